@@ -2,9 +2,20 @@
 
 from datetime import datetime
 import os
+import sys
 import shutil
-import pandas as pd
+import json
+import hashlib
 import time
+import queue
+import tempfile
+import argparse
+import threading
+import pandas as pd
+import xml.etree.ElementTree as ET
+from xml.dom import minidom
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -12,8 +23,16 @@ from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
-from selenium.common.exceptions import ElementClickInterceptedException, TimeoutException, NoSuchElementException, StaleElementReferenceException, ElementNotInteractableException
+from selenium.common.exceptions import ElementClickInterceptedException, TimeoutException, NoSuchElementException, StaleElementReferenceException, ElementNotInteractableException, SessionNotCreatedException, WebDriverException
 from webdriver_manager.chrome import ChromeDriverManager
+import NR_UploadTrace
+import NR_Inspections
+
+# The inspection archive needs pyarrow, uploading still works without it
+try:
+    import NR_Archive
+except ImportError:
+    NR_Archive = None
 
 # Path to the reviewed and edited Excel file
 def copy_with_date_time(src_path, dest_dir, base_filename):
@@ -29,10 +48,56 @@ def copy_with_date_time(src_path, dest_dir, base_filename):
     
     shutil.copy2(src_path, dest_path)
 
-# Define paths
-dest_dir = "F:\\NR CCI UPLOADS\\PENDING\\EXCEL COPIES"
+# Command line options
+parser = argparse.ArgumentParser(description="Upload all reviewed NR CCI inspections to Sydney Water MediaSpace.")
+parser.add_argument("--sessions", type=int, default=1, help="Number of logged-in browser sessions uploading at the same time (default: 1)")
+bulk_options = parser.add_mutually_exclusive_group()
+bulk_options.add_argument("--bulk", metavar="PACKAGE_DIR", help="Instead of driving the browser, write one MediaSpace bulk upload (MRSS) package for all rows into this folder. The rows stay pending until the package is confirmed")
+bulk_options.add_argument("--bulk-confirm", metavar="PACKAGE", help="Once MediaSpace has ingested a bulk package, record its rows as uploaded (ledger, PDF REPORTS, UPLOADED folder and Excel file)")
+bulk_options.add_argument("--bulk-cancel", metavar="PACKAGE", help="Return the rows of a bulk package that was not ingested to the normal uploads")
+parser.add_argument("--preflight-only", action="store_true", help="Only check the rows of the Excel file and write the pre-flight report")
+parser.add_argument("--root", default=r"F:\NR CCI UPLOADS", help="Uploads folder holding PENDING, UPLOADED and PDF REPORTS (default: F:\\NR CCI UPLOADS)")
+parser.add_argument("--session-cache", default=os.path.join(os.path.expanduser("~"), ".nr_cci_uploader"), help="Folder for the cached chromedriver and the browser profiles (default: ~/.nr_cci_uploader)")
+parser.add_argument("--prefetch", type=int, default=2, metavar="K", help="Copy the videos and PDFs of the next K rows to local disk while the current row uploads (default: 2, 0 turns it off)")
+parser.add_argument("--scratch-dir", default=os.path.join(tempfile.gettempdir(), "nr_cci_scratch"), help="Local folder the upcoming rows' files are copied to (default: in the temp folder)")
+parser.add_argument("--scratch-mb", type=float, default=4096, help="Most MB of copies kept in the scratch folder (default: 4096)")
+parser.add_argument("--base-url", default="https://media.sydneywater.com.au/", help="MediaSpace address (default: the Sydney Water site)")
+parser.add_argument("--implicit-wait", type=float, default=0, help="Implicit wait in seconds, set once per browser session (default: 0, every step waits explicitly)")
+parser.add_argument("--timeout", action="append", default=[], metavar="STEP=SECONDS", help="Override the timeout of a kind of step: login, page, video_upload, attachment or publish (repeatable)")
+args = parser.parse_args()
+
+# Define paths (all below the uploads root, F:\NR CCI UPLOADS unless --root is given)
+uploads_root = args.root
+dest_dir = os.path.join(uploads_root, "PENDING", "EXCEL COPIES")
 base_filename = "COPY.xlsx"
-output_file_path = r"F:\NR CCI UPLOADS\PENDING\compiled_data.xlsx"
+output_file_path = os.path.join(uploads_root, "PENDING", "compiled_data.xlsx")
+journal_file_path = os.path.join(uploads_root, "PENDING", "upload_journal.jsonl")
+ledger_file_path = os.path.join(uploads_root, "upload_ledger.jsonl")
+fingerprint_cache_file_path = os.path.join(uploads_root, "upload_ledger_hashes.jsonl")
+preflight_report_file_path = os.path.join(uploads_root, "PENDING", "preflight_report.csv")
+pdf_reports_dir = os.path.join(uploads_root, "PDF REPORTS")
+# Job folders are moved into a folder named after the current date within "UPLOADED"
+uploaded_dir = os.path.join(uploads_root, "UPLOADED", datetime.now().strftime('%d%m%Y'))
+NR_UploadTrace.trace_file_path = os.path.join(uploads_root, "upload_trace.jsonl")
+archive_dir = os.path.join(uploads_root, "ARCHIVE")
+
+# Local cache for the chromedriver binary and one browser profile per session, so later runs can reuse a valid login
+session_cache_dir = args.session_cache
+driver_cache_file_path = os.path.join(session_cache_dir, "chromedriver.json")
+
+# Seconds each kind of step may take before it fails
+step_timeouts = {
+    "login": 300,  # Sydney Water Staff / organisational sign-in pages
+    "page": 60,  # Page loads, menus and form fields
+    "video_upload": 300,  # Video transfer until "Upload Completed!"
+    "attachment": 120,  # PDF attachment upload and save
+    "publish": 30,  # Each attempt at a publish tab control
+}
+for timeout in args.timeout:
+    step, _, seconds = timeout.partition("=")
+    if step not in step_timeouts or not seconds:
+        parser.error(f"invalid --timeout '{timeout}', expected one of {', '.join(step_timeouts)} followed by =SECONDS")
+    step_timeouts[step] = float(seconds)
 
 # Copy the file with date and time appended to the filename
 copy_with_date_time(output_file_path, dest_dir, base_filename)
@@ -41,23 +106,126 @@ copy_with_date_time(output_file_path, dest_dir, base_filename)
 # Load the reviewed data
 data = pd.read_excel(output_file_path)
 
-# Set up Selenium WebDriver
-options = Options()
-options.add_argument("--start-maximized")
-options.add_argument("--disable-web-security")
-options.add_argument("--disable-gpu")
-options.add_argument("--no-sandbox")
-options.add_argument("--disable-dev-shm-usage")
-options.add_argument("--window-size=1920x1080")  # Set window size to a common resolution
-options.add_argument("--headless")
-options.add_argument("--disable-extensions")
-options.add_argument("--log-level=3")  # Suppress warnings and informational messages
-#options.add_argument("--incognito")
+# Function to get the chromedriver binary, only downloading it when there is no cached copy (or refresh=True)
+driver_cache_lock = threading.Lock()
+def chromedriver_path(refresh=False):
+    with driver_cache_lock:
+        if not refresh and os.path.exists(driver_cache_file_path):
+            with open(driver_cache_file_path, 'r', encoding='utf-8') as f:
+                cached_path = json.load(f).get("path")
+            if cached_path and os.path.exists(cached_path):
+                return cached_path
+        path = ChromeDriverManager().install()
+        os.makedirs(session_cache_dir, exist_ok=True)
+        with open(driver_cache_file_path, 'w', encoding='utf-8') as f:
+            json.dump({"path": path}, f)
+        return path
+
+# Set up a Selenium WebDriver, one per browser session
+def create_driver(session_number):
+    options = Options()
+    options.add_argument("--start-maximized")
+    options.add_argument("--disable-web-security")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--window-size=1920x1080")  # Set window size to a common resolution
+    options.add_argument("--headless")
+    options.add_argument("--disable-extensions")
+    options.add_argument("--log-level=3")  # Suppress warnings and informational messages
+    #options.add_argument("--incognito")
+    # Keep each session's cookies between runs so a still valid login can be reused
+    options.add_argument(f"--user-data-dir={os.path.join(session_cache_dir, 'profiles', f'session_{session_number}')}")
+
+    try:
+        driver = webdriver.Chrome(service=Service(chromedriver_path()), options=options)
+    except SessionNotCreatedException:
+        # The cached chromedriver no longer matches the installed Chrome
+        driver = webdriver.Chrome(service=Service(chromedriver_path(refresh=True)), options=options)
+    # Set once here; every step below waits explicitly for the state it needs
+    driver.implicitly_wait(args.implicit_wait)
+    return driver
 
-driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
 
+# Metadata fields of the upload form: customdata-* ID -> value for a row of compiled_data.xlsx.
+# Fields that take several values (one input each, added with the field's "+" button) are given a list
+customdata_field_map = {
+    "ParentWorkOrderNumber0": lambda row: metadata_text(row['JSA/WO']),
+    "ChildWorkOrderNumbers": lambda row: [part.strip() for part in str(row['Child WO']).split(',')],
+    "WorkOrderDescription0": lambda row: str(row['WO description']),
+    "AssetNumbers": lambda row: [part.strip() for part in str(row['Pipe Asset ID']).split(',')],
+    "TaskCode": lambda row: str(row['Task code']),
+    "Suburb0": lambda row: str(row['Suburb']),
+    "AddressStreet0": lambda row: str(row['Address/Location']),
+    "Product0": lambda row: "Wastewater",
+    "Contractor": lambda row: "COMDAININF-001",
+    "UpstreamMH": lambda row: metadata_text(row['US MH']),
+    "DownstreamMH": lambda row: metadata_text(row['DS MH']),
+    "DirectionOfSurvey": lambda row: str(row['Inspection Direction']),
+    "DateOfCompletedInspection": lambda row: str(row['Date of inspection']),
+    "TimeOfCompletedInspection": lambda row: str(row['Time of inspection']),
+    "PackageName": lambda row: str(row['PackageName']),
+    "Cleaned0": lambda row: str(row['Cleaning']),
+    "SurveyedLength0": lambda row: str(row['Inspected Length [m]']) + "m",
+    "Location0": lambda row: str(row['Operational Area']),
+    "PriorityJustification": lambda row: str(row['Upload Priority Justification']),
+}
 
-def wait_for_element_and_click(xpath, max_attempts=3, wait_time=30):
+# Function to get the values of all metadata fields for a row
+def customdata_values(row):
+    return {field_id: value(row) for field_id, value in customdata_field_map.items()}
+
+# Sets every metadata field in the browser: adds the inputs a repeated field needs, then sets each value and fires the
+# input and change events typing would. Returns the IDs of any fields missing from the page
+fill_customdata_script = """
+var values = arguments[0];
+var missing = [];
+Object.keys(values).forEach(function (fieldId) {
+    var fieldValues = Array.isArray(values[fieldId]) ? values[fieldId] : [values[fieldId]];
+    var inputs;
+    if (Array.isArray(values[fieldId])) {
+        var name = 'customdata[' + fieldId + '][]';
+        var addButton = document.getElementById('customdata-' + fieldId + '-addBtn');
+        for (var added = 0; addButton && added < fieldValues.length && document.getElementsByName(name).length < fieldValues.length; added++) {
+            addButton.click();
+        }
+        inputs = document.getElementsByName(name);
+    } else {
+        inputs = [document.getElementById('customdata-' + fieldId)];
+    }
+    if (inputs.length < fieldValues.length || !inputs[0]) {
+        missing.push(fieldId);
+        return;
+    }
+    fieldValues.forEach(function (value, i) {
+        inputs[i].value = value;
+        inputs[i].dispatchEvent(new Event('input', {bubbles: true}));
+        inputs[i].dispatchEvent(new Event('change', {bubbles: true}));
+    });
+});
+return missing;
+"""
+
+
+attachment_save_xpath = "//a[contains(@class, 'btn attachment-save-btn btn-primary')]"
+
+# Wait condition: the attachment save button, once the PDF upload has finished and the button is enabled
+def attachment_save_ready(driver):
+    for save_button in driver.find_elements(By.XPATH, attachment_save_xpath):
+        if save_button.is_displayed() and save_button.is_enabled() and "disabled" not in (save_button.get_attribute("class") or ""):
+            return save_button
+    return False
+
+# Function to wait until a clicked attachment save has gone through (its dialog has closed), then record the attached PDF
+def confirm_attachment_saved(driver, row):
+    WebDriverWait(driver, step_timeouts['attachment']).until(
+        EC.invisibility_of_element_located((By.XPATH, attachment_save_xpath))
+    )
+    return save_row_progress(row, "pdf_attached")
+
+
+def wait_for_element_and_click(driver, xpath, max_attempts=3, wait_time=None):
+    wait_time = wait_time or step_timeouts['publish']
     attempts = 0
     while attempts < max_attempts:
         try:
@@ -81,22 +249,42 @@ def wait_for_element_and_click(xpath, max_attempts=3, wait_time=30):
     return False
 
 
+staff_button_xpath = "//button[contains(text(), 'Sydney Water Staff')]"
+
+# Function to check whether the browser is showing the MediaSpace or organisational sign-in page
+def on_login_page(driver):
+    try:
+        return bool(driver.find_elements(By.XPATH, staff_button_xpath) or driver.find_elements(By.ID, "userNameInput"))
+    except WebDriverException:
+        return False
+
+# Function to open MediaSpace and only go through the login form if the saved session is no longer valid
+def ensure_logged_in(driver):
+    with NR_UploadTrace.span("login"):
+        driver.get(args.base_url)
+        WebDriverWait(driver, step_timeouts['login']).until(
+            lambda driver: on_login_page(driver) or driver.find_elements(By.ID, "a11y-addNewDropDown")
+        )
+        if on_login_page(driver):
+            login(driver)
+        else:
+            print("Reusing the saved MediaSpace session.")
+
+
 # Define the login function
-def login():
-    driver.get("https://media.sydneywater.com.au/")
+def login(driver):
+    driver.get(args.base_url)
     try:
         print("Attempting to find 'Sydney Water Staff' button...")
-        driver.implicitly_wait(10)
-        sydney_water_staff_button = WebDriverWait(driver, 300).until(
-            EC.element_to_be_clickable((By.XPATH, "//button[contains(text(), 'Sydney Water Staff')]"))
+        sydney_water_staff_button = WebDriverWait(driver, step_timeouts['login']).until(
+            EC.element_to_be_clickable((By.XPATH, staff_button_xpath))
         )
         driver.execute_script("arguments[0].scrollIntoView(true);", sydney_water_staff_button)
         driver.execute_script("arguments[0].click();", sydney_water_staff_button)
         print("'Sydney Water Staff' button clicked.")
         
         print("Waiting for the organizational login page to load...")
-        driver.implicitly_wait(10)
-        username_field = WebDriverWait(driver, 300).until(
+        username_field = WebDriverWait(driver, step_timeouts['login']).until(
             EC.presence_of_element_located((By.ID, "userNameInput"))
         )
         print("Username field found.")
@@ -104,16 +292,14 @@ def login():
         print("Username entered.")
         
         print("Waiting for the password field...")
-        driver.implicitly_wait(10)
-        password_field = WebDriverWait(driver, 300).until(
+        password_field = WebDriverWait(driver, step_timeouts['login']).until(
             EC.presence_of_element_located((By.ID, "passwordInput"))
         )
         print("Password field found.")
         password_field.send_keys("******")
         print("Password entered.")
         
-        driver.implicitly_wait(10)
-        sign_in_button = WebDriverWait(driver, 300).until(
+        sign_in_button = WebDriverWait(driver, step_timeouts['login']).until(
             EC.element_to_be_clickable((By.ID, "submitButton"))
         )
         driver.execute_script("arguments[0].click();", sign_in_button)
@@ -121,233 +307,169 @@ def login():
         
     except Exception as e:
         print(f"Login failed: {e}")
-        driver.save_screenshot("login_failure.png")
-        print("Screenshot of the error saved as 'login_failure.png'.")
-        driver.quit()
+        screenshot_path = f"login_failure_{threading.current_thread().name}.png"
+        driver.save_screenshot(screenshot_path)
+        print(f"Screenshot of the error saved as '{screenshot_path}'.")
         raise e
     
 
 # Define the function to fill out the form
-def fill_out_form(row):
+# Each row moves through the states in row_states; a retry (or a later run) carries on from the last state reached, on the same entry
+def fill_out_form(driver, row):
+    reauthentications = 0
+    attempt = 0
+    progress = row_progress.get(row_key(row), {"state": "new"})
+    if progress["state"] == "published":
+        print("Row was already published by an earlier run.")
+        return
     while True:
+        attempt += 1
+        # Times each named step of this attempt into the upload trace
+        steps = NR_UploadTrace.RowTrace(row_key(row), attempt)
+        # Only set once this attempt reaches the attachment dialog; an attempt resumed past it never looks the button up
+        save_file_btn = None
         try:
-            print("Waiting for the 'Add New' button to become clickable...")
-            driver.implicitly_wait(10)
-            add_new_button = WebDriverWait(driver, 300).until(
-                EC.element_to_be_clickable((By.XPATH, "//button[@id='a11y-addNewDropDown']"))
-            )
-            driver.execute_script("arguments[0].scrollIntoView(true);", add_new_button)
-            driver.execute_script("arguments[0].click();", add_new_button)
-            print("'Add New' button clicked.")
-            
-            driver.implicitly_wait(10)
-            media_upload_option = WebDriverWait(driver, 300).until(
-                EC.element_to_be_clickable((By.XPATH, "//a[@href='/upload/media']"))
-            )
-            driver.execute_script("arguments[0].click();", media_upload_option)
-            print("'Media Upload' option clicked.")
-            
-            driver.implicitly_wait(10)
-            file_input = WebDriverWait(driver, 300).until(
-                EC.presence_of_element_located((By.XPATH, "//input[@type='file']"))
-            )
-            file_input.send_keys(str(row['Inspection Video(s)']))
-            print(f"Video file uploaded.")
+            # Log in again in place if the session expired after the previous row
+            if on_login_page(driver):
+                print("MediaSpace session expired, logging in again...")
+                steps.step("relogin")
+                login(driver)
 
-            driver.implicitly_wait(10)
-            name_field = WebDriverWait(driver, 300).until(
-                EC.presence_of_element_located((By.ID, "Entry-name"))
-            )
-            asset_numbers = str(row['Pipe Asset ID']).replace(', ', '_')
+            if progress["state"] == "new":
+                steps.step("add_new")
+                print("Waiting for the 'Add New' button to become clickable...")
+                add_new_button = WebDriverWait(driver, step_timeouts['page']).until(
+                    EC.element_to_be_clickable((By.XPATH, "//button[@id='a11y-addNewDropDown']"))
+                )
+                driver.execute_script("arguments[0].scrollIntoView(true);", add_new_button)
+                driver.execute_script("arguments[0].click();", add_new_button)
+                print("'Add New' button clicked.")
 
-            title1 = '' if pd.isna(row['Priority Justification']) else str(row['Priority Justification'])
+                media_upload_option = WebDriverWait(driver, step_timeouts['page']).until(
+                    EC.element_to_be_clickable((By.XPATH, "//a[@href='/upload/media']"))
+                )
+                driver.execute_script("arguments[0].click();", media_upload_option)
+                print("'Media Upload' option clicked.")
 
-            name_field.send_keys(f"{title1}_{asset_numbers}_{int(row['JSA/WO'])}_{row['Location Scamp']}_{int(row['Attempt #'])}")
-            
-            # Switch to the iframe for the WYSIWYG editor
-            driver.implicitly_wait(10)
-            iframe = WebDriverWait(driver, 300).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, "iframe.wysihtml5-sandbox"))
-            )
-            driver.switch_to.frame(iframe)
-            
-            # Locate the body of the WYSIWYG editor and send keys
-            driver.implicitly_wait(10)
-            description_body = WebDriverWait(driver, 300).until(
-                EC.presence_of_element_located((By.TAG_NAME, "body"))
-            )
-            description_body.clear()  # Clear any existing content
-            description_body.send_keys(str(row['General comment']))
+                file_input = WebDriverWait(driver, step_timeouts['page']).until(
+                    EC.presence_of_element_located((By.XPATH, "//input[@type='file']"))
+                )
+                file_input.send_keys(upload_path(str(row['Inspection Video(s)']), row))
+                print(f"Video file uploaded.")
+                # The video transfers in the background while the form is filled in
+                video_bytes = os.path.getsize(str(row['Inspection Video(s)']))
+                transfer_started = time.perf_counter()
 
-            # Switch back to the main document
-            driver.switch_to.default_content()
+                steps.step("metadata")
+                name_field = WebDriverWait(driver, step_timeouts['page']).until(
+                    EC.presence_of_element_located((By.ID, "Entry-name"))
+                )
+                name_field.send_keys(str(row['Upload Title']))
 
-            # Check the cleaned field for "JJ" or "jj" to set the tags field
-            tags_field = driver.find_element(By.ID, "s2id_autogen2")
-            tags = "junctionjet" if "JJ" in str(row['Cleaning']) or "jj" in str(row['Cleaning']) else "cctv"
-            tags_field.send_keys(tags)
-            time.sleep(2)  # Allow time for the dropdown to appear
-            tags_field.send_keys(Keys.ENTER)
+                # Switch to the iframe for the WYSIWYG editor
+                iframe = WebDriverWait(driver, step_timeouts['page']).until(
+                    EC.presence_of_element_located((By.CSS_SELECTOR, "iframe.wysihtml5-sandbox"))
+                )
+                driver.switch_to.frame(iframe)
 
-            parent_wo_field = driver.find_element(By.ID, "customdata-ParentWorkOrderNumber0")
-            parent_wo_field.send_keys(str(row['JSA/WO']) if isinstance(row['JSA/WO'], str) else int(row['JSA/WO']))
-            
-            child_wo_numbers = str(row['Child WO']).split(',')
-            for i, child_wo_number in enumerate(child_wo_numbers):
-                child_wo_fields = driver.find_elements(By.XPATH, "//input[@name='customdata[ChildWorkOrderNumbers][]']")
-                add_button = driver.find_element(By.ID, "customdata-ChildWorkOrderNumbers-addBtn")
-                
-                if i < len(child_wo_fields):
-                    child_wo_fields[i].send_keys(child_wo_number.strip())
-                else:
-                    driver.execute_script("arguments[0].click();", add_button)
-                    child_wo_fields = driver.find_elements(By.XPATH, "//input[@name='customdata[ChildWorkOrderNumbers][]']")
-                    child_wo_fields[i].send_keys(child_wo_number.strip())
-            
-            wo_description_field = driver.find_element(By.ID, "customdata-WorkOrderDescription0")
-            wo_description_field.send_keys(str(row['WO description']))
-            
-            asset_numbers = str(row['Pipe Asset ID']).split(',')
-            for i, asset_number in enumerate(asset_numbers):
-                asset_fields = driver.find_elements(By.XPATH, "//input[@name='customdata[AssetNumbers][]']")
-                add_button = driver.find_element(By.ID, "customdata-AssetNumbers-addBtn")
-                
-                if i < len(asset_fields):
-                    asset_fields[i].send_keys(asset_number.strip())
-                else:
-                    driver.execute_script("arguments[0].click();", add_button)
-                    asset_fields = driver.find_elements(By.XPATH, "//input[@name='customdata[AssetNumbers][]']")
-                    asset_fields[i].send_keys(asset_number.strip())
-
-            task_code_field = driver.find_element(By.ID, "customdata-TaskCode")
-            task_code_field.send_keys(str(row['Task code']))
-            
-            suburb_field = driver.find_element(By.ID, "customdata-Suburb0")
-            suburb_field.send_keys(str(row['Suburb']))
-            
-            address_st_field = driver.find_element(By.ID, "customdata-AddressStreet0")
-            address_st_field.send_keys(str(row['Address/Location']))
-            
-            product_field = driver.find_element(By.ID, "customdata-Product0")
-            product_field.send_keys("Wastewater")
-            
-            contractor_field = driver.find_element(By.ID, "customdata-Contractor")
-            contractor_field.send_keys("COMDAININF-001")
-            
-            usmh_field = driver.find_element(By.ID, "customdata-UpstreamMH")
-            usmh_field.send_keys(str(row['US MH']) if isinstance(row['US MH'], str) else int(row['US MH']))
-            
-            dsmh_field = driver.find_element(By.ID, "customdata-DownstreamMH")
-            dsmh_field.send_keys(str(row['DS MH']) if isinstance(row['DS MH'], str) else int(row['DS MH']))
-            
-            direction_of_survey_field = driver.find_element(By.ID, "customdata-DirectionOfSurvey")
-            direction_of_survey_field.send_keys(str(row['Inspection Direction']))
-            
-            date_field = driver.find_element(By.ID, "customdata-DateOfCompletedInspection")
-            date_field.send_keys(str(row['Date of inspection']))
-            
-            time_field = driver.find_element(By.ID, "customdata-TimeOfCompletedInspection")
-            time_field.send_keys(str(row['Time of inspection']))
-            
-            package_name_field = driver.find_element(By.ID, "customdata-PackageName")
-            package_name_field.send_keys(str(row['PackageName']))
-            
-            cleaned_field = driver.find_element(By.ID, "customdata-Cleaned0")
-            cleaned_field.send_keys(str(row['Cleaning']))
-            
-            surveyed_length_field = driver.find_element(By.ID, "customdata-SurveyedLength0")
-            surveyed_length_field.send_keys(str(row['Inspected Length [m]']) + "m")
-            
-            location_scamp_field = driver.find_element(By.ID, "customdata-Location0")
-            location_scamp_field.send_keys(str(row['Operational Area'])) 
+                # Locate the body of the WYSIWYG editor and send keys
+                description_body = WebDriverWait(driver, step_timeouts['page']).until(
+                    EC.presence_of_element_located((By.TAG_NAME, "body"))
+                )
+                description_body.clear()  # Clear any existing content
+                description_body.send_keys(str(row['General comment']))
 
-            priority_justification_values = ["CRIT", "CRCM", "MHIP", "WATW", "WACC", "WAEP", "WAER", "INTS", "ODOR", "ODCC", "MULT", "MULC", "OPER", "OPCC", "OPSC", "OPOH", "REPT", "RECC", "SALT", "SEEP", "SECC", "SUBX", "SUCC", "SUSC", "SUBS", "WETW", "WECC"]
-            priority_justification = str(row['Priority Justification']) if any(val in str(row['Priority Justification']) for val in priority_justification_values) else "OTHER"
+                # Switch back to the main document
+                driver.switch_to.default_content()
 
-            priority_justification_field = driver.find_element(By.ID, "customdata-PriorityJustification")
-            priority_justification_field.send_keys(priority_justification)
-        
-            driver.implicitly_wait(10)
-            WebDriverWait(driver,  300).until(
-                lambda driver: "Upload Completed!" in driver.find_element(By.XPATH, "//div[contains(@class, 'alert-success')]//strong").text
-            )
-            print("Video upload complete.")
-            time.sleep(1) 
+                # The tag ("junctionjet" or "cctv") is derived from the reviewed row in the pre-flight check
+                tags_field = WebDriverWait(driver, step_timeouts['page']).until(
+                    EC.element_to_be_clickable((By.ID, "s2id_autogen2"))
+                )
+                tags_field.send_keys(str(row['Upload Tag']))
+                # Wait for the select2 dropdown to highlight the typed tag before choosing it
+                WebDriverWait(driver, step_timeouts['page']).until(
+                    EC.visibility_of_element_located((By.CSS_SELECTOR, ".select2-drop-active .select2-highlighted"))
+                )
+                tags_field.send_keys(Keys.ENTER)
 
-            save_button = driver.find_element(By.ID, "Entry-submit")
-            driver.execute_script("arguments[0].click();", save_button)
-            print("Saved after video uploading")
+                # Every metadata field in one script call instead of a find_element and send_keys per field
+                missing_fields = driver.execute_script(fill_customdata_script, customdata_values(row))
+                if missing_fields:
+                    raise NoSuchElementException(f"Metadata field(s) not found on the upload form: {', '.join(missing_fields)}")
 
-            driver.implicitly_wait(10)
-            go_to_media_button = WebDriverWait(driver, 300).until(
-                EC.element_to_be_clickable((By.XPATH, "//a[@id='back']"))
-            )
-            driver.execute_script("arguments[0].click();", go_to_media_button)
-            print("Clicked 'Go to Media'.")
+                steps.step("upload_wait")
+                WebDriverWait(driver, step_timeouts['video_upload']).until(
+                    lambda driver: "Upload Completed!" in driver.find_element(By.XPATH, "//div[contains(@class, 'alert-success')]//strong").text
+                )
+                print("Video upload complete.")
+                NR_UploadTrace.record("video_transfer", time.perf_counter() - transfer_started, row_key(row), attempt, video_bytes)
+
+                steps.step("save_entry")
+                save_button = WebDriverWait(driver, step_timeouts['page']).until(
+                    EC.element_to_be_clickable((By.ID, "Entry-submit"))
+                )
+                driver.execute_script("arguments[0].click();", save_button)
+                print("Saved after video uploading")
+
+                steps.step("edit_navigation")
+                go_to_media_button = WebDriverWait(driver, step_timeouts['page']).until(
+                    EC.element_to_be_clickable((By.XPATH, "//a[@id='back']"))
+                )
+                # The entry now exists with its video and metadata; later retries start from its page
+                progress = save_row_progress(row, "entry_saved", go_to_media_button.get_attribute("href"))
+                driver.execute_script("arguments[0].click();", go_to_media_button)
+                print("Clicked 'Go to Media'.")
+            else:
+                steps.step("resume")
+                print(f"Resuming the row from '{progress['state']}' on its existing entry {progress['entry_url']}")
+                driver.get(progress["entry_url"])
             
-            driver.implicitly_wait(10)
-            actions_button = WebDriverWait(driver, 300).until(
+            actions_button = WebDriverWait(driver, step_timeouts['page']).until(
                 EC.element_to_be_clickable((By.XPATH, "//button[@id='entryActionsMenuBtn']"))
             )
             driver.execute_script("arguments[0].click();", actions_button)
             print("Clicked 'Actions' button.")
 
-            driver.implicitly_wait(10)
-            edit_option = WebDriverWait(driver, 300).until(
+            edit_option = WebDriverWait(driver, step_timeouts['page']).until(
                 EC.element_to_be_clickable((By.XPATH, "//a[@id='tab-Edit']"))
             )
             driver.execute_script("arguments[0].click();", edit_option)
             print("Selected 'Edit' option.")
 
-            driver.implicitly_wait(10)
-            attachments_tab = WebDriverWait(driver, 300).until(
-                EC.element_to_be_clickable((By.XPATH, "//a[@id='attachments-tab-tab']"))
-            )
-            driver.execute_script("arguments[0].click();", attachments_tab)
-            print("Selected 'attachments' tab.")
-            
-            driver.implicitly_wait(10)
-            upload_file_btn = WebDriverWait(driver, 300).until(
-                EC.element_to_be_clickable((By.XPATH, "//a[contains(@href, '/attachments/index/add/entryid') and contains(@class, 'btn btn-primary')]"))
-            )
-            driver.execute_script("arguments[0].click();", upload_file_btn)
-            print("Selected 'Upload file' button.")
-            
-            driver.implicitly_wait(10)
-            file_input = WebDriverWait(driver, 300).until(
-                EC.presence_of_element_located((By.XPATH, "//input[@id='attachments_fileinput']"))
-            )
-            file_input.send_keys(str(row['Section PDF Filename']))
+            if progress["state"] == "entry_saved":
+                attachments_tab = WebDriverWait(driver, step_timeouts['page']).until(
+                    EC.element_to_be_clickable((By.XPATH, "//a[@id='attachments-tab-tab']"))
+                )
+                driver.execute_script("arguments[0].click();", attachments_tab)
+                print("Selected 'attachments' tab.")
 
-            print(f"PDF file uploaded")
-            
-            driver.implicitly_wait(10)
-            save_file_btn = WebDriverWait(driver, 300).until(
-                EC.element_to_be_clickable((By.XPATH, "//a[contains(@class, 'btn attachment-save-btn btn-primary')]"))
-            )
+                steps.step("pdf_attach", bytes_uploaded=os.path.getsize(str(row['Section PDF Filename'])))
+                upload_file_btn = WebDriverWait(driver, step_timeouts['page']).until(
+                    EC.element_to_be_clickable((By.XPATH, "//a[contains(@href, '/attachments/index/add/entryid') and contains(@class, 'btn btn-primary')]"))
+                )
+                driver.execute_script("arguments[0].click();", upload_file_btn)
+                print("Selected 'Upload file' button.")
 
-            # Extract and adjust the date of inspection
-            try:
-                inspection_time = pd.to_datetime(row['Time of inspection'], format='%H:%M:%S').time()
-            except ValueError:
-                inspection_time = pd.to_datetime(row['Time of inspection'], format='%H:%M').time()
-
-            inspection_date = pd.to_datetime(row['Date of inspection'], dayfirst=True)
-
-            # Check if the inspection was done between midnight and 5:30 AM
-            if inspection_time >= datetime.strptime('00:00', '%H:%M').time() and inspection_time <= datetime.strptime('05:30', '%H:%M').time():
-                inspection_date -= pd.Timedelta(days=1)
-
-            # Format the adjusted date
-            date_of_inspection = inspection_date.strftime('%d%m%Y')
-            pdf_filename = f"{row['JSA/WO']} CCTV REPORT {date_of_inspection}.pdf"
-            shutil.copy(str(row['Section PDF Filename']), f"F:\\NR CCI UPLOADS\\PDF REPORTS\\{pdf_filename}")
-            time.sleep(1)
-            driver.execute_script("arguments[0].click();", save_file_btn)
-            print(f"Saved Uploaded PDF as '{pdf_filename}' and saved to 'PDF REPORTS' folder.")
-
-            driver.implicitly_wait(10)
-            publish_tab = WebDriverWait(driver, 300).until(
+                file_input = WebDriverWait(driver, step_timeouts['page']).until(
+                    EC.presence_of_element_located((By.XPATH, "//input[@id='attachments_fileinput']"))
+                )
+                file_input.send_keys(upload_path(str(row['Section PDF Filename']), row))
+
+                print(f"PDF file uploaded")
+
+                # The save button is only usable once the PDF has finished uploading
+                save_file_btn = WebDriverWait(driver, step_timeouts['attachment']).until(attachment_save_ready)
+
+                # The report name (with the date rolled back for inspections between midnight and 5:30 AM) is derived in the pre-flight check
+                pdf_filename = str(row['Upload PDF Report Name'])
+                queue_side_effect("copy_pdf", str(row['Section PDF Filename']), os.path.join(pdf_reports_dir, pdf_filename))
+                driver.execute_script("arguments[0].click();", save_file_btn)
+                progress = confirm_attachment_saved(driver, row)
+                print(f"Saved Uploaded PDF as '{pdf_filename}' and queued its copy to the 'PDF REPORTS' folder.")
+
+            steps.step("publish")
+            publish_tab = WebDriverWait(driver, step_timeouts['page']).until(
                 EC.element_to_be_clickable((By.XPATH, "//a[@id='Publish-tab']"))
             )
             driver.execute_script("arguments[0].click();", publish_tab)
@@ -355,76 +477,717 @@ def fill_out_form(row):
             
             # Select 'Published' option
             published_xpath = "//input[@id='published_entry'][@value='published']"
-            if not wait_for_element_and_click(published_xpath):
+            if not wait_for_element_and_click(driver, published_xpath):
                 print("\nRETRYING UPLOAD...\n")
-                continue  # Retry the form filling process
+                steps.close("retry")
+                continue  # Retry the publish step on the same entry
 
             # Select 'COMDAININF-001' box
-            comdaininf_checkbox = driver.find_element(By.XPATH, "//input[@id='CategoryTree-214'][@value='1']")
             comdaininf_xpath = "//input[@id='CategoryTree-214'][@value='1']"
-            if not wait_for_element_and_click(comdaininf_xpath):
+            if not wait_for_element_and_click(driver, comdaininf_xpath):
                 print("\nRETRYING UPLOAD...\n")
-                continue  # Retry the form filling process
+                steps.close("retry")
+                continue  # Retry the publish step on the same entry
 
             # Click final save
             final_save_button = "//button[contains(@class, 'btn btn-primary pblSave')]"
-            if not wait_for_element_and_click(final_save_button):
+            if not wait_for_element_and_click(driver, final_save_button):
                 print("\nRETRYING UPLOAD...\n")
-                continue  # Retry the form filling process
+                steps.close("retry")
+                continue  # Retry the publish step on the same entry
 
-            # Remove the processed row from the DataFrame and save the updated DataFrame
-            print(f"Processed and removed row from the Excel file.")
+            save_row_progress(row, "published")
+            # The row is removed from the Excel file when the run ends (compact_excel)
+            print(f"Published row. It will be removed from the Excel file at the end of the run.")
+            steps.close("ok")
             break
             
         except ElementClickInterceptedException as e:
+            steps.close("error", f"ElementClickInterceptedException: {e}")
             print(f"ElementClickInterceptedException: {e}")
-            driver.execute_script("arguments[0].click();", save_file_btn)
-            print("Clicked 'Save' button using JavaScript.")
+            # Only the attachment save is clicked again here; anything else is retried from the last saved state
+            if save_file_btn is None or progress["state"] != "entry_saved":
+                continue
+            try:
+                driver.execute_script("arguments[0].click();", save_file_btn)
+                print("Clicked 'Save' button using JavaScript.")
+                progress = confirm_attachment_saved(driver, row)
+            except TimeoutException:
+                print("The PDF was not saved, attaching it again.")
         except StaleElementReferenceException as e:
+            steps.close("error", f"StaleElementReferenceException: {e}")
             print(f"StaleElementReferenceException: {e}")
-            save_file_btn = WebDriverWait(driver, 300).until(
-                EC.element_to_be_clickable((By.XPATH, "//a[contains(@class, 'btn attachment-save-btn btn-primary')]"))
-            )
-            driver.execute_script("arguments[0].click();", save_file_btn)
-            print("Retried clicking 'Save' button.")
+            if save_file_btn is None or progress["state"] != "entry_saved":
+                continue
+            try:
+                # The dialog may already have closed, the save having gone through
+                if driver.find_elements(By.XPATH, attachment_save_xpath):
+                    save_file_btn = WebDriverWait(driver, step_timeouts['attachment']).until(attachment_save_ready)
+                    driver.execute_script("arguments[0].click();", save_file_btn)
+                    print("Retried clicking 'Save' button.")
+                progress = confirm_attachment_saved(driver, row)
+            except TimeoutException:
+                print("The PDF was not saved, attaching it again.")
         except ElementNotInteractableException as e:
+            # The next attempt opens the entry's page directly (or starts again from 'Add New' if it was not saved yet)
+            steps.close("error", f"ElementNotInteractableException: {e}")
             print(f"ElementNotInteractableException: {e}")
-            driver.execute_script("arguments[0].click();", go_to_media_button)
-            print("Clicked 'Go to Media' using JavaScript.")
         except Exception as e:
+            steps.close("error", f"{type(e).__name__}: {e}")
+            # A session that expired part way through the row: log in again and retry the same row
+            if on_login_page(driver) and reauthentications < 2:
+                reauthentications += 1
+                print(f"MediaSpace session expired during the upload ({e}), logging in again and retrying the row...")
+                with NR_UploadTrace.span("relogin", row_key(row), attempt):
+                    login(driver)
+                continue
             print(f"Form filling failed: {e}")
-            driver.save_screenshot("form_filling_failure.png")
-            print("Screenshot of the error saved as 'form_filling_failure.png'.")
-            driver.quit()
+            screenshot_path = f"form_filling_failure_{threading.current_thread().name}.png"
+            driver.save_screenshot(screenshot_path)
+            print(f"Screenshot of the error saved as '{screenshot_path}'.")
             raise e
 
 
+# Function to build the identity of a row that stays the same across runs
+def row_key(row):
+    return f"{row['JSA/WO']}|{row['Inspection Video(s)']}|{row['Attempt #']}"
+
+# Function to read an append-only JSON lines file (the progress journal or the upload ledger)
+def read_json_lines(file_path):
+    entries = []
+    if os.path.exists(file_path):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    pass  # A line cut short by a crash
+    return entries
+
+# Function to append one entry to a JSON lines file and make sure it reaches the disk
+def append_json_line(file_path, entry):
+    with open(file_path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+# Progress journal left by earlier (possibly killed) runs: uploaded rows, and queued and finished file side-effects
+journal_entries = read_json_lines(journal_file_path)
+done_keys = {entry["key"] for entry in journal_entries if "key" in entry}
+if done_keys:
+    print(f"Skipping {len(done_keys)} row(s) already uploaded according to '{journal_file_path}'.")
+
+# States a row goes through in fill_out_form. Saving the upload form creates the entry with its video and metadata in one go,
+# so a row that has not reached "entry_saved" has no entry to return to and starts again from "Add New"
+row_states = ["new", "entry_saved", "pdf_attached", "published"]
+
+# How far each unfinished row got in earlier attempts or runs: row key -> {"state", "entry_url"}
+row_progress = {}
+for entry in journal_entries:
+    if "progress" in entry:
+        row_progress[entry["progress"]] = {"state": entry["state"], "entry_url": entry.get("entry_url")}
+
+# Rows written to a bulk package that has not been confirmed or cancelled yet: row key -> package folder
+bulk_packages = {}
+for entry in journal_entries:
+    if "packaged" in entry:
+        bulk_packages[entry["packaged"]] = entry["package"]
+    elif "unpackaged" in entry:
+        bulk_packages.pop(entry["unpackaged"], None)
+
+# Function to record the state a row has reached (and the page of its entry), so a retry can resume from there
+def save_row_progress(row, state, entry_url=None):
+    with progress_lock:
+        progress = row_progress.setdefault(row_key(row), {"state": "new", "entry_url": None})
+        progress["state"] = state
+        if entry_url is not None:
+            progress["entry_url"] = entry_url
+        append_json_line(journal_file_path, {"progress": row_key(row), **progress, "time": datetime.now().isoformat(timespec='seconds')})
+    return progress
+
+# Rows shared between the browser sessions, handed out one at a time in spreadsheet order
+pending_rows = [row for _, row in data.iterrows()
+                if not pd.isna(row['Inspected Length [m]'])  # Skip rows with NaN in 'Inspected Length [m]'
+                and row_key(row) not in done_keys]
+# Rows waiting in a bulk package are left out until MediaSpace has ingested the package (--bulk-confirm) or it is cancelled (--bulk-cancel)
+packaged_rows = [row for row in pending_rows if row_key(row) in bulk_packages]
+pending_rows = [row for row in pending_rows if row_key(row) not in bulk_packages]
+next_row_position = 0
+folders_to_move = {entry["folder"] for entry in journal_entries if "folder" in entry}
+progress_lock = threading.Lock()
+stop_event = threading.Event()
+
+# Function to hand the next pending row to a session (None once all rows are taken or a session has failed)
+def take_next_row():
+    global next_row_position
+    with progress_lock:
+        if stop_event.is_set() or next_row_position >= len(pending_rows):
+            return None
+        row = pending_rows[next_row_position]
+        next_row_position += 1
+        upcoming_rows = pending_rows[next_row_position:next_row_position + args.prefetch]
+    # Copy the following rows' files to local disk while this one uploads
+    for upcoming_row in upcoming_rows:
+        stage_row(upcoming_row)
+    return row
+
+# Function to get the job folder a row's video belongs to
+def job_folder(row):
+    video_path = str(row['Inspection Video(s)'])
+    return os.path.dirname(os.path.dirname(os.path.dirname(video_path)))
+
+# Function to record an uploaded row in the journal (the Excel file is only rewritten once, at the end of the run)
+def mark_row_done(row):
+    # Collect the folders to move
+    parent_folder = job_folder(row)
+    with progress_lock:
+        append_json_line(journal_file_path, {"key": row_key(row), "folder": parent_folder, "time": datetime.now().isoformat(timespec='seconds')})
+        done_keys.add(row_key(row))
+        folders_to_move.add(parent_folder)
+        rows_left_in_folder[parent_folder] = rows_left_in_folder.get(parent_folder, 1) - 1
+        folder_finished = rows_left_in_folder[parent_folder] <= 0
+    # Move the job folder in the background as soon as its last row of this run is done
+    if folder_finished:
+        queue_side_effect("move_folder", parent_folder, os.path.join(uploaded_dir, os.path.basename(parent_folder)))
+
+# Function to record a row written to a bulk package in the journal (it stays pending until the package is confirmed)
+def mark_row_packaged(row, package_dir):
+    with progress_lock:
+        append_json_line(journal_file_path, {"packaged": row_key(row), "package": package_dir, "time": datetime.now().isoformat(timespec='seconds')})
+        bulk_packages[row_key(row)] = package_dir
+
+# Function to get the rows waiting in a bulk package
+def rows_in_package(package_dir):
+    package_dir = os.path.normcase(os.path.abspath(package_dir))
+    return [row for row in packaged_rows if os.path.normcase(os.path.abspath(bulk_packages[row_key(row)])) == package_dir]
+
+
+# File side-effects (PDF report copies and job folder moves) run on a background worker while the next row uploads.
+# Each one is journaled when queued and when done, so a killed run replays exactly the unfinished ones
+post_processing_queue = queue.Queue()
+queued_tasks = set()
+failed_tasks = []
+
+# Function to carry out one file side-effect; running it again after it has finished does nothing
+def run_side_effect(task):
+    source, destination = task["source"], task["destination"]
+    if task["action"] == "copy_pdf":
+        if os.path.exists(destination) and os.path.getsize(destination) == os.path.getsize(source):
+            return  # Already copied
+        shutil.copy(source, destination)
+    elif task["action"] == "move_folder":
+        if not os.path.exists(source):
+            return  # Already moved
+        # Let copies still being read out of the folder finish first
+        wait_for_staging(source)
+        if os.path.exists(destination):
+            print(f"Folder {destination} already exists. Skipping move operation.")
+            return
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.move(source, destination)
+
+# Function run by the background worker until it receives None
+def post_processing_worker():
+    while True:
+        task = post_processing_queue.get()
+        if task is None:
+            break
+        try:
+            run_side_effect(task)
+            with progress_lock:
+                append_json_line(journal_file_path, {"done": task["id"], "time": datetime.now().isoformat(timespec='seconds')})
+        except Exception as e:
+            print(f"WARNING -- {task['action'].upper()} FAILED FOR {task['source']}: {e}")
+            failed_tasks.append(task)
+
+# Function to hand a file side-effect to the background worker (each one is only queued once)
+def queue_side_effect(action, source, destination, journal=True):
+    task = {"id": f"{action}|{source}|{destination}", "action": action, "source": source, "destination": destination}
+    with progress_lock:
+        if task["id"] in queued_tasks:
+            return
+        queued_tasks.add(task["id"])
+        if journal:
+            append_json_line(journal_file_path, {"queued": task, "time": datetime.now().isoformat(timespec='seconds')})
+    post_processing_queue.put(task)
+
+# Local staging of the upcoming rows' videos and PDFs, so Chrome reads them from local disk rather than the F: drive.
+# Copies are kept least recently used first and limited to --scratch-mb in total
+staging_lock = threading.Lock()
+staged_files = OrderedDict()  # Job folder path -> {"local", "bytes", "future", "wanted_by", "read_by"}
+staged_bytes = 0
+scratch_limit = args.scratch_mb * 1024 * 1024
+prefetch_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="prefetch")  # Two readers keep the drive busy without thrashing it
+
+# Function to copy a file into the scratch folder; the copy only appears under its final name once complete
+def copy_to_scratch(source, local):
+    os.makedirs(os.path.dirname(local), exist_ok=True)
+    shutil.copyfile(source, local + ".part")
+    os.replace(local + ".part", local)
+    return local
+
+# Function to drop a staged copy (the staging lock must be held)
+def remove_staged(source):
+    global staged_bytes
+    staged = staged_files.pop(source)
+    staged_bytes -= staged["bytes"]
+    # A copy still being made is removed once it finishes
+    staged["future"].add_done_callback(lambda future: remove_file(staged["local"]))
+
+# Function to delete a file that may not exist
+def remove_file(file_path):
+    try:
+        os.remove(file_path)
+    except OSError:
+        pass
+
+# Function to start copying a file an upcoming row needs, unless it is already staged or there is no room for it
+def stage_file(source, key):
+    global staged_bytes
+    size = os.path.getsize(source)
+    with staging_lock:
+        if source in staged_files:
+            staged_files[source]["wanted_by"].add(key)
+            return
+        # Make room by dropping the least recently used copies no row needs any more. Copies the nearer rows are waiting for
+        # are never dropped for a later row; the later row is staged again once earlier rows are published and make room
+        for other_source in list(staged_files):
+            if staged_bytes + size <= scratch_limit:
+                break
+            other = staged_files[other_source]
+            if not other["wanted_by"] and not other["read_by"]:
+                remove_staged(other_source)
+        if staged_bytes + size > scratch_limit:
+            return  # No room for now, the row reads this file from its job folder unless it is staged later
+        # Files with the same name from different job folders get their own subfolder, so the uploaded name stays the same
+        local = os.path.join(args.scratch_dir, hashlib.blake2b(source.encode('utf-8'), digest_size=6).hexdigest(), os.path.basename(source))
+        staged_files[source] = {"local": local, "bytes": size, "future": prefetch_executor.submit(copy_to_scratch, source, local), "wanted_by": {key}, "read_by": set()}
+        staged_bytes += size
+
+# Function to stage a row's video and PDF
+def stage_row(row):
+    for column in ['Inspection Video(s)', 'Section PDF Filename']:
+        try:
+            stage_file(str(row[column]), row_key(row))
+        except OSError:
+            pass  # Missing files are reported by the pre-flight check
+
+# Function to get the path Chrome should upload a file from: its local copy if staged, otherwise the job folder
+def upload_path(source, row):
+    with staging_lock:
+        staged = staged_files.get(source)
+        if staged is None:
+            return source
+        staged["read_by"].add(row_key(row))
+        staged_files.move_to_end(source)
+        future = staged["future"]
+    try:
+        # A copy still in progress is finished first, it reads the same drive Chrome otherwise would
+        return future.result()
+    except OSError as e:
+        print(f"WARNING -- STAGING {source} FAILED ({e}), UPLOADING IT FROM THE JOB FOLDER.")
+        return source
+
+# Function to drop a finished row's local copies (a PDF is kept while another staged row of its job still needs it)
+def release_row(row):
+    key = row_key(row)
+    with staging_lock:
+        for column in ['Inspection Video(s)', 'Section PDF Filename']:
+            staged = staged_files.get(str(row[column]))
+            if staged is None:
+                continue
+            staged["wanted_by"].discard(key)
+            staged["read_by"].discard(key)
+            if not staged["wanted_by"] and not staged["read_by"]:
+                remove_staged(str(row[column]))
+
+# Function to wait for any copies still being made from files in the given folder
+def wait_for_staging(folder):
+    with staging_lock:
+        futures = [staged["future"] for source, staged in staged_files.items() if source.startswith(folder + os.sep)]
+    wait(futures)
+
+# Function to remove every row's local copies
+def remove_scratch():
+    with staging_lock:
+        staged_files.clear()
+    shutil.rmtree(args.scratch_dir, ignore_errors=True)
+
+# Function to record uploaded rows in the inspection archive, so the compiler can flag them if they are compiled again
+def archive_uploads(uploaded_rows):
+    if NR_Archive is None:
+        print("WARNING -- UPLOADS NOT RECORDED IN THE INSPECTION ARCHIVE (pyarrow is not installed)")
+        return
+    try:
+        recorded = NR_Archive.record_uploads(uploaded_rows, archive_dir)
+    except Exception as e:
+        print(f"WARNING -- UPLOADS NOT RECORDED IN THE INSPECTION ARCHIVE: {e}")
+        return
+    print(f"Recorded {recorded} uploaded inspection(s) in the archive in '{archive_dir}'.")
+
+# Function to remove all uploaded rows from the Excel file in one write, leaving the file untouched if none of its rows were uploaded
+def compact_excel():
+    if not len(data):
+        return
+    uploaded = data.apply(row_key, axis=1).isin(done_keys)
+    if not uploaded.any():
+        return
+    # Rows uploaded by a run that was stopped before this point are still in the Excel file, so they are recorded here too
+    archive_uploads(data[uploaded])
+    remaining = data[~uploaded]
+    temp_path = output_file_path.replace(".xlsx", "_compacting.xlsx")
+    remaining.to_excel(temp_path, index=False)
+    os.replace(temp_path, output_file_path)
+    print(f"Removed {len(data) - len(remaining)} uploaded row(s) from the Excel file.")
+
+# Ledger of every published video, kept across runs and months: video fingerprint -> ledger entry
+ledger_lock = threading.Lock()
+published_videos = {entry["video"]: entry for entry in read_json_lines(ledger_file_path)}
+# Fingerprints already worked out, appended one per line as they are found: path, size and mtime -> fingerprint
+fingerprint_cache = {entry["file"]: entry["fingerprint"] for entry in read_json_lines(fingerprint_cache_file_path)}
+
+# Function to fingerprint a file by its size and a hash of its first and last MB, cached by path, size and mtime
+# so a large video is never read again unless it changes
+fingerprint_chunk_size = 1024 * 1024
+def fingerprint(path):
+    stat = os.stat(path)
+    cache_key = f"{path}|{stat.st_size}|{stat.st_mtime}"
+    with ledger_lock:
+        if cache_key in fingerprint_cache:
+            return fingerprint_cache[cache_key]
+
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        if stat.st_size <= 2 * fingerprint_chunk_size:
+            digest.update(f.read())
+        else:
+            digest.update(f.read(fingerprint_chunk_size))
+            f.seek(-fingerprint_chunk_size, os.SEEK_END)
+            digest.update(f.read(fingerprint_chunk_size))
+    file_fingerprint = f"{stat.st_size}-{digest.hexdigest()}"
+
+    with ledger_lock:
+        fingerprint_cache[cache_key] = file_fingerprint
+        append_json_line(fingerprint_cache_file_path, {"file": cache_key, "fingerprint": file_fingerprint})
+    return file_fingerprint
+
+# Function to check the ledger for a row whose video has already been published (prints the earlier entry)
+def already_published(row):
+    try:
+        video_fingerprint = fingerprint(str(row['Inspection Video(s)']))
+    except OSError:
+        return False  # A missing video is reported when the row is uploaded
+    entry = published_videos.get(video_fingerprint)
+    if entry is None:
+        return False
+    print(f"WARNING -- VIDEO {row['Inspection Video(s)']} WAS ALREADY PUBLISHED AS '{entry['name']}' (WO {entry['wo']}) ON {entry['time']}. SKIPPING.")
+    return True
+
+# Function to record a published row's video and PDF in the ledger
+def record_published(row, via="browser"):
+    entry = {
+        "video": fingerprint(str(row['Inspection Video(s)'])),
+        "pdf": fingerprint(str(row['Section PDF Filename'])),
+        "name": str(row['Upload Title']),
+        "wo": str(row['JSA/WO']),
+        "via": via,
+        "time": datetime.now().isoformat(timespec='seconds'),
+    }
+    with ledger_lock:
+        append_json_line(ledger_file_path, entry)
+        published_videos[entry["video"]] = entry
+
+# Function to turn a cell into metadata text (whole numbers without ".0", empty cells as "")
+def metadata_text(value):
+    if pd.isna(value):
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+# Function to write all pending rows as one MediaSpace bulk upload (MRSS) drop folder package
+# Returns the package folder, or None if there was nothing to package
+def write_bulk_package(rows, package_root):
+    if not rows:
+        print("No rows left to package.")
+        return None
+    package_dir = os.path.abspath(os.path.join(package_root, f"NR_BULK_{datetime.now().strftime('%d%m%Y_%H%M')}"))
+    os.makedirs(package_dir, exist_ok=True)
+    root = ET.Element("mrss", {"xmlns:xsi": "http://www.w3.org/2001/XMLSchema-instance"})
+    channel = ET.SubElement(root, "channel")
+
+    for position, row in enumerate(rows, start=1):
+        # The drop folder holds its own copy of every file, numbered so videos with the same name in different jobs don't clash
+        video_filename = f"{position:03d}_{os.path.basename(str(row['Inspection Video(s)']))}"
+        shutil.copy2(str(row['Inspection Video(s)']), os.path.join(package_dir, video_filename))
+        pdf_filename = str(row['Upload PDF Report Name'])
+        if not os.path.exists(os.path.join(package_dir, pdf_filename)):
+            shutil.copy2(str(row['Section PDF Filename']), os.path.join(package_dir, pdf_filename))
+
+        item = ET.SubElement(channel, "item")
+        action = ET.SubElement(item, "action")
+        action.text = "add"
+        type_element = ET.SubElement(item, "type")
+        type_element.text = "1"
+        userId = ET.SubElement(item, "userId")
+        userId.text = "COMDAININF001"
+        name = ET.SubElement(item, "name")
+        name.text = str(row['Upload Title'])
+        description = ET.SubElement(item, "description")
+        description.text = metadata_text(row['General comment'])
+        tags = ET.SubElement(item, "tags")
+        tag = ET.SubElement(tags, "tag")
+        tag.text = str(row['Upload Tag'])
+        categories = ET.SubElement(item, "categories")
+        category = ET.SubElement(categories, "category")
+        category.text = "MediaSpace>site>galleries>CCTV>COMDAININF-001"
+        media = ET.SubElement(item, "media")
+        mediaType = ET.SubElement(media, "mediaType")
+        mediaType.text = "1"
+        contentAssets = ET.SubElement(item, "contentAssets")
+        content = ET.SubElement(contentAssets, "content")
+        dropFolderFileContentResource = ET.SubElement(content, "dropFolderFileContentResource", filePath=video_filename)
+        attachments = ET.SubElement(item, "attachments")
+        action = ET.SubElement(attachments, "action")
+        action.text = "update"
+        attachment = ET.SubElement(attachments, "attachment", format="3")
+        dropFolderFileContentResource = ET.SubElement(attachment, "dropFolderFileContentResource", filePath=pdf_filename)
+        filename = ET.SubElement(attachment, "filename")
+        filename.text = pdf_filename
+        title = ET.SubElement(attachment, "title")
+        title.text = pdf_filename.replace(".pdf", "")
+        customDataItems = ET.SubElement(item, "customDataItems")
+        customData = ET.SubElement(customDataItems, "customData", metadataProfileId="187")
+        xmlData = ET.SubElement(customData, "xmlData")
+        metadata = ET.SubElement(xmlData, "metadata")
+        parentWorkOrderNumber = ET.SubElement(metadata, "ParentWorkOrderNumber")
+        parentWorkOrderNumber.text = metadata_text(row['JSA/WO'])
+        childWorkOrderNumbers = ET.SubElement(metadata, "ChildWorkOrderNumbers")
+        childWorkOrderNumbers.text = ', '.join(part.strip() for part in metadata_text(row['Child WO']).split(','))
+        workOrderDescription = ET.SubElement(metadata, "WorkOrderDescription")
+        workOrderDescription.text = metadata_text(row['WO description'])
+        assetNumbers = ET.SubElement(metadata, "AssetNumbers")
+        assetNumbers.text = ', '.join(part.strip() for part in metadata_text(row['Pipe Asset ID']).split(','))
+        taskCode = ET.SubElement(metadata, "TaskCode")
+        taskCode.text = metadata_text(row['Task code'])
+        suburb = ET.SubElement(metadata, "Suburb")
+        suburb.text = metadata_text(row['Suburb'])
+        addressStreet = ET.SubElement(metadata, "AddressStreet")
+        addressStreet.text = metadata_text(row['Address/Location'])
+        product = ET.SubElement(metadata, "Product")
+        product.text = "Wastewater"
+        contractor = ET.SubElement(metadata, "Contractor")
+        contractor.text = "COMDAININF-001"
+        upstreamMH = ET.SubElement(metadata, "UpstreamMH")
+        upstreamMH.text = metadata_text(row['US MH'])
+        downstreamMH = ET.SubElement(metadata, "DownstreamMH")
+        downstreamMH.text = metadata_text(row['DS MH'])
+        directionOfSurvey = ET.SubElement(metadata, "DirectionOfSurvey")
+        directionOfSurvey.text = metadata_text(row['Inspection Direction'])
+        dateOfCompletedInspection = ET.SubElement(metadata, "DateOfCompletedInspection")
+        dateOfCompletedInspection.text = metadata_text(row['Date of inspection'])
+        timeOfCompletedInspection = ET.SubElement(metadata, "TimeOfCompletedInspection")
+        timeOfCompletedInspection.text = metadata_text(row['Time of inspection'])
+        packageName = ET.SubElement(metadata, "PackageName")
+        packageName.text = metadata_text(row['PackageName'])
+        cleaned = ET.SubElement(metadata, "Cleaned")
+        cleaned.text = metadata_text(row['Cleaning'])
+        surveyedLength = ET.SubElement(metadata, "SurveyedLength")
+        surveyedLength.text = metadata_text(row['Inspected Length [m]']) + "m"
+        location = ET.SubElement(metadata, "Location")
+        location.text = metadata_text(row['Operational Area'])
+        priorityJustification = ET.SubElement(metadata, "PriorityJustification")
+        priorityJustification.text = str(row['Upload Priority Justification'])
+
+    xml_str = ET.tostring(root, encoding='utf-8', method='xml')
+    parsed_str = minidom.parseString(xml_str)
+    pretty_xml_as_str = parsed_str.toprettyxml(indent="\t", newl="\n")
+    pretty_xml_as_str = pretty_xml_as_str.replace('<?xml version="1.0" ?>', '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>')
+    pretty_xml_as_str = pretty_xml_as_str.rstrip("\n")
+
+    xml_file_path = os.path.join(package_dir, os.path.basename(package_dir) + ".xml")
+    with open(xml_file_path, 'w', encoding='utf-8') as f:
+        f.write(pretty_xml_as_str)
+    print(f"'{xml_file_path}' generated with {len(rows)} entries. Hand the '{package_dir}' folder to the MediaSpace drop folder.")
+    print(f"Once MediaSpace has ingested it, run again with --bulk-confirm \"{package_dir}\" to record the rows as uploaded.")
+    return package_dir
+
+# Function to check that a value parses with one of the given date/time formats
+def parses_as(value, formats):
+    for date_format in formats:
+        try:
+            datetime.strptime(str(value).strip(), date_format)
+            return True
+        except ValueError:
+            pass
+    return False
+
+# Function to derive the upload values (title, tag, priority code, report name) again from the rows' reviewed source columns.
+# The compiler wrote them before QA filled in the source columns, so they are only compared (and any difference reported)
+def refresh_upload_values(rows):
+    if not rows:
+        return rows
+    derived = NR_Inspections.add_upload_columns(pd.DataFrame(rows))
+    refreshed_rows = []
+    for row in rows:
+        row = row.copy()
+        for column in NR_Inspections.upload_headers:
+            value = derived.at[row.name, column]
+            if column in row.index and metadata_text(row[column]) != metadata_text(value):
+                print(f"WARNING -- ROW {row.name + 2}: '{column}' IS SENT AS '{value}' FROM THE REVIEWED COLUMNS, NOT '{row[column]}'")
+            row[column] = value
+        refreshed_rows.append(row)
+    return refreshed_rows
+
+# Function to find everything that would make a row fail part way through its upload
+# Returns the rows that can go ahead (with their upload values derived from the reviewed columns) and a list of (Excel row number, problem) for the rest
+def preflight_check(rows):
+    rows = refresh_upload_values(rows)
+    # Look up every video and PDF at once; on the F: drive the lookups are mostly waiting
+    paths = sorted({str(row[column]) for row in rows for column in ['Inspection Video(s)', 'Section PDF Filename']})
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        path_exists = dict(zip(paths, executor.map(os.path.isfile, paths)))
+
+    valid_rows = []
+    problems = []
+    for row in rows:
+        row_problems = []
+        if not path_exists[str(row['Inspection Video(s)'])]:
+            row_problems.append(f"Video not found: {row['Inspection Video(s)']}")
+        if not str(row['Section PDF Filename']).lower().endswith('.pdf') or not path_exists[str(row['Section PDF Filename'])]:
+            row_problems.append(f"Section PDF not found: {row['Section PDF Filename']}")
+        if not metadata_text(row['JSA/WO']).isdigit():
+            row_problems.append(f"JSA/WO is not a number: {row['JSA/WO']}")
+        if not metadata_text(row['Attempt #']).isdigit():
+            row_problems.append(f"Attempt # is not a number: {row['Attempt #']}")
+        if not parses_as(row['Date of inspection'], ['%d/%m/%Y']):
+            row_problems.append(f"Date of inspection is not dd/mm/yyyy: {row['Date of inspection']}")
+        if not parses_as(row['Time of inspection'], ['%H:%M:%S', '%H:%M']):
+            row_problems.append(f"Time of inspection is not hh:mm(:ss): {row['Time of inspection']}")
+
+        if row_problems:
+            problems.extend((row.name + 2, problem) for problem in row_problems)  # Row 1 of the sheet is the header
+        else:
+            valid_rows.append(row)
+    return valid_rows, problems
+
+# Function run by each browser session: log in (unless its saved session is still valid), then upload rows until none are left
+def run_session(session_number):
+    driver = create_driver(session_number)
+    try:
+        ensure_logged_in(driver)
+        while True:
+            row = take_next_row()
+            if row is None:
+                break
+            if already_published(row):
+                release_row(row)
+                mark_row_done(row)
+                continue
+            fill_out_form(driver, row)
+            record_published(row)
+            # The local copies are no longer needed once the row is published
+            release_row(row)
+            mark_row_done(row)
+    except Exception:
+        # Stop the other sessions from starting new rows; they finish the row they are on
+        stop_event.set()
+        raise
+    finally:
+        driver.quit()
+
+
+# Bulk packages: cancelling one returns its rows to the normal uploads, confirming one finishes its rows in this run
+if args.bulk_cancel or args.bulk_confirm:
+    package_rows = rows_in_package(args.bulk_cancel or args.bulk_confirm)
+    if not package_rows:
+        print(f"WARNING -- NO ROWS ARE WAITING IN BULK PACKAGE '{args.bulk_cancel or args.bulk_confirm}'.")
+        sys.exit(1)
+    if args.bulk_cancel:
+        with progress_lock:
+            for row in package_rows:
+                append_json_line(journal_file_path, {"unpackaged": row_key(row), "time": datetime.now().isoformat(timespec='seconds')})
+        print(f"Returned {len(package_rows)} row(s) of the bulk package to the uploads.")
+        sys.exit(0)
+    package_rows = refresh_upload_values(package_rows)
+elif packaged_rows:
+    print(f"{len(packaged_rows)} row(s) are waiting in bulk package(s) {sorted(set(bulk_packages[row_key(row)] for row in packaged_rows))}. "
+          f"Confirm them with --bulk-confirm once MediaSpace has ingested them, or return them to the uploads with --bulk-cancel.")
+
+# Pre-flight: check every row before any browser time is spent, and only upload the rows that can succeed
+pending_rows, preflight_problems = preflight_check(pending_rows)
+if preflight_problems:
+    pd.DataFrame(preflight_problems, columns=["Excel row", "Problem"]).to_csv(preflight_report_file_path, index=False)
+    for excel_row, problem in preflight_problems:
+        print(f"WARNING -- ROW {excel_row}: {problem}")
+    print(f"{len({excel_row for excel_row, _ in preflight_problems})} row(s) need fixing and will be skipped. Report saved to '{preflight_report_file_path}'.")
+elif os.path.exists(preflight_report_file_path):
+    os.remove(preflight_report_file_path)
+print(f"Pre-flight check passed for {len(pending_rows)} row(s).")
+if args.preflight_only:
+    sys.exit(0)
+
+
+# Rows of this run left in each job folder; a folder is moved once all of them are done
+rows_left_in_folder = {}
+for row in pending_rows + (package_rows if args.bulk_confirm else []):
+    rows_left_in_folder[job_folder(row)] = rows_left_in_folder.get(job_folder(row), 0) + 1
+
+post_processing_thread = threading.Thread(target=post_processing_worker, name="post_processing")
+post_processing_thread.start()
+
+# Replay the side-effects a killed run queued but never finished
+finished_task_ids = {entry["done"] for entry in journal_entries if "done" in entry}
+for entry in journal_entries:
+    if "queued" in entry and entry["queued"]["id"] not in finished_task_ids:
+        task = entry["queued"]
+        queue_side_effect(task["action"], task["source"], task["destination"], journal=False)
+
+
 # Main script execution
 try:
-    login()
-    folders_to_move = set()
-    for index, row in data.iterrows():
-        if pd.isna(row['Inspected Length [m]']):
-            continue  # Skip rows with NaN in 'Inspected Length [m]'
-        fill_out_form(row)
-        # Collect the folders to move
-        video_path = str(row['Inspection Video(s)'])
-        parent_folder = os.path.dirname(os.path.dirname(os.path.dirname(video_path)))
-        folders_to_move.add(parent_folder)
-        # Remove the processed row from the DataFrame and save the updated DataFrame
-        data.drop(index, inplace=True)
-        data.to_excel(output_file_path, index=False)
+    if args.bulk_confirm:
+        # MediaSpace has ingested the package: its rows now count as uploaded
+        for row in package_rows:
+            record_published(row, via="bulk")
+            queue_side_effect("copy_pdf", str(row['Section PDF Filename']), os.path.join(pdf_reports_dir, str(row['Upload PDF Report Name'])))
+            mark_row_done(row)
+        print(f"Recorded {len(package_rows)} row(s) of the bulk package as uploaded.")
+    elif args.bulk:
+        # Bulk submission: one file hand-off instead of the browser; the rows stay pending until the package is confirmed
+        rows_to_package = []
+        for row in pending_rows:
+            if already_published(row):
+                mark_row_done(row)
+            else:
+                rows_to_package.append(row)
+        package_dir = write_bulk_package(rows_to_package, args.bulk)
+        for row in rows_to_package:
+            mark_row_packaged(row, package_dir)
+    else:
+        with ThreadPoolExecutor(max_workers=max(1, args.sessions), thread_name_prefix="session") as executor:
+            futures = [executor.submit(run_session, session_number) for session_number in range(max(1, args.sessions))]
+            for future in as_completed(futures):
+                future.result()
     print("COMPLETED")
 finally:
-    driver.quit()
-    # Create a new folder with the current date and time within "UPLOADED" folder
-    current_date_time_folder = datetime.now().strftime('%d%m%Y')
-    destination_root_folder = os.path.join("F:\\NR CCI UPLOADS\\UPLOADED", current_date_time_folder)
-    os.makedirs(destination_root_folder, exist_ok=True)
-    # Move the collected folders to the new generated folder
-    for folder in folders_to_move:
-        destination_folder = os.path.join(destination_root_folder, os.path.basename(folder))
-        if not os.path.exists(destination_folder):
-            shutil.move(folder, destination_folder)
-        else:
-            print(f"Folder {destination_folder} already exists. Skipping move operation.")
+    # Stop staging before the remaining folders are moved
+    prefetch_executor.shutdown(wait=True, cancel_futures=True)
+    # Move the collected folders that still have rows left (e.g. after a failed row) as well, then let the worker finish.
+    # Folders with rows waiting in a bulk package stay until the package is confirmed
+    waiting_rows = [row for _, row in data.iterrows() if row_key(row) in bulk_packages and row_key(row) not in done_keys]
+    for folder in folders_to_move - {job_folder(row) for row in waiting_rows}:
+        queue_side_effect("move_folder", folder, os.path.join(uploaded_dir, os.path.basename(folder)))
+    post_processing_queue.put(None)
+    post_processing_thread.join()
+    remove_scratch()
+    # Drop the uploaded rows from the Excel file in a single write
+    compact_excel()
+    # Unless something is left to finish, everything in the journal is now reflected in the Excel file, PDF REPORTS and the UPLOADED folder
+    unfinished_rows = [key for key, progress in row_progress.items() if key not in done_keys and progress["state"] != "new"]
+    if failed_tasks:
+        print(f"WARNING -- {len(failed_tasks)} FILE OPERATION(S) FAILED, THEY WILL BE RETRIED ON THE NEXT RUN.")
+    if unfinished_rows:
+        print(f"WARNING -- {len(unfinished_rows)} ROW(S) STOPPED PART WAY, THE NEXT RUN RESUMES THEM ON THEIR EXISTING ENTRIES.")
+    if not failed_tasks and not unfinished_rows and not waiting_rows and os.path.exists(journal_file_path):
+        os.remove(journal_file_path)
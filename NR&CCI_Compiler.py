@@ -4,14 +4,32 @@ import pandas as pd
 import os
 import sys
 import re
+import json
+import argparse
 import warnings
-from openpyxl import load_workbook
+from concurrent.futures import ThreadPoolExecutor
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Alignment, Font, PatternFill
 from openpyxl.utils import get_column_letter
+import NR_Inspections
+
+# The inspection archive needs pyarrow, compiling still works without it
+try:
+    import NR_Archive
+except ImportError:
+    NR_Archive = None
 
 # Directory paths
 base_dir = r"F:\NR CCI UPLOADS\PENDING"
 output_file_path = os.path.join(base_dir, "compiled_data.xlsx")
+manifest_file_path = os.path.join(base_dir, "compile_manifest.json")
+
+# Command line options
+parser = argparse.ArgumentParser(description="Compile all pending NR CCI inspection data into one spreadsheet.")
+parser.add_argument("--workers", type=int, default=1, help="Number of job folders to read at the same time (default: 1, one after another)")
+parser.add_argument("--full", action="store_true", help="Ignore the ingest manifest and re-read every job folder")
+args = parser.parse_args()
 
 warnings.filterwarnings("ignore", category=FutureWarning, message="The behavior of DataFrame concatenation with empty or all-NA entries is deprecated.")
 warnings.filterwarnings("ignore", category=UserWarning, message="Parsing dates in %d/%m/%Y %H:%M:%S format when dayfirst=False")
@@ -45,33 +63,85 @@ def extract_wo_number(folder_name):
         sys.exit(1)
 
 
-# Traverse directories and compile data
-compiled_data = pd.DataFrame(columns=column_headers)
-for folder_name in os.listdir(base_dir):
+# Function to load the ingest manifest written by the previous run (folder path -> file signature and rows)
+def load_manifest(file_path):
+    if args.full or not os.path.exists(file_path):
+        return {}
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        print(f"WARNING -- COULD NOT READ '{file_path}', RE-READING ALL JOB FOLDERS")
+        return {}
+
+# Function to save the ingest manifest, replacing the old one only once the new one is fully written
+def save_manifest(file_path, manifest):
+    temp_path = file_path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(temp_path, file_path)
+
+previous_manifest = load_manifest(manifest_file_path)
+
+# Function to read and normalise the inspection data of a single job folder
+# Returns (folder path, manifest entry, whether the entry came from the manifest) or None for non-job folders
+def read_job_folder(folder_name):
     folder_path = os.path.join(base_dir, folder_name)
-    if os.path.isdir(folder_path):
-        docu_path = os.path.join(folder_path, "misc", "docu")
-        if os.path.exists(docu_path):
-            excel_file_path = find_excel_file(docu_path)
-            pdf_file_path = os.path.join(docu_path, [f for f in os.listdir(docu_path) if f.endswith('.pdf')][0])
-            video_base_path = os.path.join(folder_path, "Video", "Sec")
-            data = pd.read_excel(excel_file_path)
-            
-            data.columns = column_headers[:len(data.columns)]
-            
-            # Update "Section PDF Filename", "Inspection Video(s)", "PackageName", and "JSA/WO" columns
-            data["Section PDF Filename"] = pdf_file_path
-            data["Inspection Video(s)"] = data["Inspection Video(s)"].apply(
-                lambda x: os.path.join(video_base_path, x) if pd.notna(x) else x
-            )
-            data["PackageName"] = data["PackageName"].fillna("Reactive")  # Set default value
-            wo_number = extract_wo_number(folder_name)
-            data["JSA/WO"], data["Child WO"] = wo_number, wo_number
-            temp = data["PackageName"]
-            temp1 = data["General comment"]
-            data["General comment"] = temp
-            data["PackageName"] = temp1
-            compiled_data = pd.concat([compiled_data, data], ignore_index=True)
+    if not os.path.isdir(folder_path):
+        return None
+    docu_path = os.path.join(folder_path, "misc", "docu")
+    if not os.path.exists(docu_path):
+        return None
+    excel_file_path = find_excel_file(docu_path)
+    pdf_file_name = [f for f in os.listdir(docu_path) if f.endswith('.pdf')][0]
+    excel_stat = os.stat(excel_file_path)
+    signature = {"excel": excel_file_path, "mtime": excel_stat.st_mtime, "size": excel_stat.st_size, "pdf": pdf_file_name}
+
+    # Reuse the rows from the last run if the job sheet and PDF have not changed
+    cached_entry = previous_manifest.get(folder_path)
+    if cached_entry is not None and cached_entry["signature"] == signature:
+        return folder_path, cached_entry, True
+
+    pdf_file_path = os.path.join(docu_path, pdf_file_name)
+    video_base_path = os.path.join(folder_path, "Video", "Sec")
+    data = pd.read_excel(excel_file_path)
+
+    data.columns = column_headers[:len(data.columns)]
+
+    # Update "Section PDF Filename", "Inspection Video(s)", "PackageName", and "JSA/WO" columns
+    data["Section PDF Filename"] = pdf_file_path
+    data["Inspection Video(s)"] = data["Inspection Video(s)"].apply(
+        lambda x: os.path.join(video_base_path, x) if pd.notna(x) else x
+    )
+    data["PackageName"] = data["PackageName"].fillna("Reactive")  # Set default value
+    wo_number = extract_wo_number(folder_name)
+    data["JSA/WO"], data["Child WO"] = wo_number, wo_number
+    temp = data["PackageName"]
+    temp1 = data["General comment"]
+    data["General comment"] = temp
+    data["PackageName"] = temp1
+
+    # Store the rows the same way they are stored in the manifest, so fresh and cached folders compile identically
+    rows = json.loads(data.to_json(orient='split', index=False, date_format='iso'))
+    return folder_path, {"signature": signature, "columns": rows["columns"], "rows": rows["data"]}, False
+
+
+# Traverse directories and compile data
+# Folders are read in a bounded thread pool (the work is mostly waiting on the F: drive). map() returns the
+# results in listing order, so the compiled sheet is identical to reading the folders one after another
+with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+    folder_results = [result for result in executor.map(read_job_folder, os.listdir(base_dir)) if result is not None]
+
+# Folders that are no longer in PENDING simply drop out of the new manifest
+manifest = {folder_path: entry for folder_path, entry, _ in folder_results}
+changed_folders = [folder_path for folder_path, _, cached in folder_results if not cached]
+if not changed_folders and manifest.keys() == previous_manifest.keys() and os.path.exists(output_file_path):
+    print(f"No job folders changed since the last compile. '{output_file_path}' is up to date.")
+    sys.exit(0)
+print(f"Read {len(changed_folders)} new or changed job folder(s), reused {len(manifest) - len(changed_folders)} from the manifest.")
+
+folder_frames = [pd.DataFrame(entry["rows"], columns=entry["columns"]) for entry in manifest.values()]
+compiled_data = pd.concat([pd.DataFrame(columns=column_headers)] + folder_frames, ignore_index=True)
 
 # Filter out unnecessary rows
 columns_to_check = [col for col in column_headers if col != "Inspected Length [m]" and col != "Section PDF Filename" and col != "JSA/WO" and col != "PackageName" and col != "General comment"]
@@ -80,101 +150,81 @@ compiled_data = compiled_data.dropna(how='all', subset=columns_to_check)
 # Sort the data by WO number, "Date of inspection", and "Time of inspection"
 compiled_data = compiled_data.sort_values(by=["JSA/WO", "Date of inspection", "Time of inspection"])
 
-
-# Function to remove inspections within the same JSA/WO that occur within a 10-hour span
-def remove_close_inspections(df):
-    df['DateTime'] = pd.to_datetime(df['Date of inspection'] + ' ' + df['Time of inspection'])
-    filtered_df = pd.DataFrame(columns=df.columns)
-    for wo in df['JSA/WO'].unique():
-        wo_df = df[df['JSA/WO'] == wo].sort_values(by='DateTime', ascending=False)
-        wo_df = wo_df.reset_index(drop=True)
-        keep_rows = []
-        for i in range(len(wo_df)):
-            if not keep_rows:
-                keep_rows.append(i)
-            else:
-                if (wo_df.loc[keep_rows[-1], 'DateTime'] - wo_df.loc[i, 'DateTime']).total_seconds() >= 36000:
-                    keep_rows.append(i)
-        filtered_df = pd.concat([filtered_df, wo_df.loc[keep_rows]], ignore_index=True)
-    filtered_df = filtered_df.drop(columns=['DateTime'])
-    return filtered_df
-
-compiled_data = remove_close_inspections(compiled_data)
-
-# Save the compiled data to an Excel file
-compiled_data.to_excel(output_file_path, index=False)
-print(f"Compiled data saved to '{output_file_path}'")
-
-# Correct the headers by swapping "PackageName" and "General comment"
-def correct_headers(file_path):
-    wb = load_workbook(file_path)
-    ws = wb.active
-    
-    # Find the indices of "PackageName" and "General comment"
-    package_name_idx = column_headers.index("PackageName") + 1  # 1-based index
-    general_comment_idx = column_headers.index("General comment") + 1  # 1-based index
-
-    # Swap the headers
-    temp = ws.cell(row=1, column=package_name_idx).value
-    ws.cell(row=1, column=package_name_idx).value = ws.cell(row=1, column=general_comment_idx).value
-    ws.cell(row=1, column=general_comment_idx).value = temp
-    
-    wb.save(file_path)
-    wb.close()  # Close the workbook to release the file
-
-# Apply formatting to the generated Excel file
-def format_excel(file_path):
-    wb = load_workbook(file_path)
-    ws = wb.active
-
-    # Check if all cells in "Client Defined 2" are empty and hide the column if true
-    client_defined_2_column_index = column_headers.index("Client Defined 2") + 1  # 1-based index
-    client_defined_2_empty = all(ws.cell(row=row, column=client_defined_2_column_index).value is None for row in range(2, ws.max_row + 1))
-    if client_defined_2_empty:
-        ws.column_dimensions[get_column_letter(client_defined_2_column_index)].hidden = True
-
-    # Set column widths
-    for col in ws.columns:
-        max_length = 0
-        column = col[0].column_letter
-        for cell in col:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = (max_length + 2)
-        # Set regular size for specific columns
-        if column_headers[col[0].column - 1] in ["Inspection Video(s)"]:
-            adjusted_width = 20  # Adjust this value as needed
+# Remove inspections within the same JSA/WO that occur within a 10-hour span
+compiled_data = NR_Inspections.remove_close_inspections(compiled_data)
+
+
+# Preview of the values the uploader will send, for QA. NA&CCI_Web.py derives them again from the reviewed columns
+compiled_data = NR_Inspections.add_upload_columns(compiled_data)
+
+# Flag inspections that NA&CCI_Web.py has already uploaded, so QA can remove them before they are sent again
+if NR_Archive is not None:
+    compiled_data["Previously Uploaded"] = NR_Archive.previous_uploads(compiled_data)
+    previously_uploaded = compiled_data[compiled_data["Previously Uploaded"] != ""]
+    for _, row in previously_uploaded.iterrows():
+        print(f"WARNING -- {row['JSA/WO']} {row['Pipe Asset ID']} ON {row['Date of inspection']} WAS ALREADY UPLOADED IN {row['Previously Uploaded']}")
+
+# Write the compiled data and all of its formatting to the Excel file in a single streaming pass
+def write_compiled_workbook(df, file_path):
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Sheet1")
+    headers = list(df.columns)
+    values = df.astype(object).where(df.notna(), None)
+
+    # Column widths and visibility have to be set before any rows are streamed
+    for col_index, header in enumerate(headers, start=1):
+        column = get_column_letter(col_index)
+        if header == "Inspection Video(s)":
+            adjusted_width = 20  # Set regular size for specific columns
+        elif header == "Section PDF Filename":
+            adjusted_width = 15  # Fixed width (normal size)
+        else:
+            max_length = values[header].dropna().astype(str).str.len().max()
+            adjusted_width = max(len(header), 0 if pd.isna(max_length) else int(max_length)) + 2
         ws.column_dimensions[column].width = adjusted_width
 
-    # Set the "Section PDF Filename" column to a fixed width (normal size)
-    section_pdf_column_index = column_headers.index("Section PDF Filename") + 1  # 1-based index
-    ws.column_dimensions[get_column_letter(section_pdf_column_index)].width = 15  # Adjust this value as needed
+        # Hide "Client Defined 2" if all of its cells are empty
+        if header == "Client Defined 2" and values[header].isna().all():
+            ws.column_dimensions[column].hidden = True
 
-    # Set header font to bold
     header_font = Font(bold=True)
-    for cell in ws[1]:
+    center_alignment = Alignment(horizontal='center', vertical='center')
+    light_orange_fill = PatternFill(start_color="FFD966", end_color="FFD966", fill_type="solid")
+    columns_to_color = ["Attempt #", "General comment", "PackageName", "Cleaning", "Child WO", "WO description", "Task code", "Location Scamp", "Priority Justification", "Operational Area", "JSA/WO"]
+
+    # Header row, with the "PackageName" and "General comment" headers swapped to match their swapped data
+    swapped_headers = {"PackageName": "General comment", "General comment": "PackageName"}
+    header_cells = []
+    for header in headers:
+        cell = WriteOnlyCell(ws, value=swapped_headers.get(header, header))
         cell.font = header_font
+        cell.alignment = center_alignment
+        if header in columns_to_color:
+            cell.fill = light_orange_fill
+        header_cells.append(cell)
+    ws.append(header_cells)
 
     # Center align all cells
-    for row in ws.iter_rows():
-        for cell in row:
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-
-    # Color specific cells in the first row with light orange
-    light_orange_fill = PatternFill(start_color="FFD966", end_color="FFD966", fill_type="solid")
-    columns_to_color = ["Attempt #", "General comment", "PackageName", "Cleaning", "Child WO", "WO description", "Task code", "Location Scamp", "Priority Justification", "Operational Area", "JSA/WO"]
-    for col in columns_to_color:
-        col_index = column_headers.index(col) + 1  # 1-based index
-        ws.cell(row=1, column=col_index).fill = light_orange_fill
+    for row in values.itertuples(index=False):
+        row_cells = []
+        for value in row:
+            cell = WriteOnlyCell(ws, value=value)
+            cell.alignment = center_alignment
+            row_cells.append(cell)
+        ws.append(row_cells)
 
     wb.save(file_path)
-    wb.close()  # Close the workbook to release the file
 
-# Apply formatting
-format_excel(output_file_path)
+# Save the compiled data to an Excel file
+write_compiled_workbook(compiled_data, output_file_path)
+print(f"Compiled data saved to '{output_file_path}'")
+
+# Add this batch to the inspection archive
+if NR_Archive is None:
+    print("WARNING -- INSPECTION ARCHIVE NOT UPDATED (pyarrow is not installed)")
+else:
+    archived_rows = NR_Archive.append_batch(compiled_data.drop(columns=["Previously Uploaded"]))
+    print(f"Added {archived_rows} new inspection(s) to the archive in '{NR_Archive.archive_dir}'")
 
-# Correct the headers
-correct_headers(output_file_path)
+# Record what was compiled so the next run only reads new or changed job folders
+save_manifest(manifest_file_path, manifest)
@@ -0,0 +1,151 @@
+# This program keeps a history of every batch compiled under the NR contract, and of the inspections uploaded from them, so past inspections can be looked up without opening the dated Excel copies
+
+import os
+import re
+import sys
+import time
+import argparse
+from datetime import datetime
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+# Directory paths
+archive_dir = r"F:\NR CCI UPLOADS\ARCHIVE"
+
+# Columns that identify a single inspection across batches
+key_columns = ["JSA/WO", "Pipe Asset ID", "Date of inspection", "Time of inspection"]
+
+# Folder layout of the archive: one folder per inspection month, then one per WO (e.g. month=2024-05\wo=91171698)
+partitioning = ds.partitioning(pa.schema([("month", pa.string()), ("wo", pa.string())]), flavor="hive")
+
+# Folder within the archive recording when each inspection was uploaded (written by NA&CCI_Web.py). The leading "_" keeps
+# it out of the compiled batches dataset
+uploads_folder = "_uploads"
+
+# Function to open the archive, or None if nothing has been archived yet
+def open_archive(path=archive_dir):
+    if not os.path.exists(path):
+        return None
+    return ds.dataset(path, format="parquet", partitioning=partitioning)
+
+# Function to build one key string per inspection from the key columns (always a Series, also for an empty frame)
+def inspection_keys(df):
+    columns = df[key_columns].astype("string").fillna("")
+    return columns[key_columns[0]].str.cat([columns[column] for column in key_columns[1:]], sep="|")
+
+# Function to get the month each recorded inspection was first uploaded in (inspection key -> month)
+def upload_months(path=archive_dir):
+    uploads_path = os.path.join(path, uploads_folder)
+    if not os.path.exists(uploads_path):
+        return pd.Series(dtype="string")
+    uploads = ds.dataset(uploads_path, format="parquet").to_table(columns=key_columns + ["Uploaded Month"]).to_pandas()
+    return uploads.assign(key=inspection_keys(uploads)).groupby("key")["Uploaded Month"].min()
+
+# Function to find, for every row, the month an identical inspection was already uploaded in ("" if never)
+def previous_uploads(df, path=archive_dir):
+    return inspection_keys(df).map(upload_months(path)).fillna("")
+
+# Function to record uploaded inspections in the archive, skipping the ones already recorded
+def record_uploads(df, path=archive_dir):
+    if df.empty:
+        return 0
+    keys = inspection_keys(df)
+    df = df[~keys.isin(upload_months(path).index) & ~keys.duplicated()]
+    if df.empty:
+        return 0
+
+    uploaded_at = datetime.now()
+    uploads = df[key_columns].astype("string")
+    uploads["Uploaded At"] = pd.Timestamp(uploaded_at)
+    uploads["Uploaded Month"] = uploaded_at.strftime("%Y-%m")
+    ds.write_dataset(
+        pa.Table.from_pandas(uploads, preserve_index=False), os.path.join(path, uploads_folder), format="parquet",
+        basename_template=f"uploads-{uploaded_at.strftime('%Y%m%d_%H%M%S_%f')}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore"
+    )
+    return len(uploads)
+
+# Function to append a compiled batch to the archive, skipping inspections that are already in it
+def append_batch(df, path=archive_dir):
+    if df.empty:
+        return 0
+    keys = inspection_keys(df)
+    dataset = open_archive(path)
+    archived_keys = set() if dataset is None else set(inspection_keys(dataset.to_table(columns=key_columns).to_pandas()))
+    df = df[~keys.isin(archived_keys) & ~keys.duplicated()]
+    if df.empty:
+        return 0
+
+    # Every source column is stored as text, so batches with differently typed cells share one schema
+    compiled_at = datetime.now()
+    batch = df.astype("string")
+    inspection_date = pd.to_datetime(df["Date of inspection"], dayfirst=True, errors='coerce')
+    batch["Inspection Date"] = inspection_date
+    batch["Compiled At"] = pd.Timestamp(compiled_at)
+    batch["Compiled Month"] = compiled_at.strftime("%Y-%m")
+    batch["month"] = inspection_date.dt.strftime("%Y-%m").fillna("unknown")
+    batch["wo"] = df["JSA/WO"].astype("string").fillna("unknown")
+
+    ds.write_dataset(
+        pa.Table.from_pandas(batch, preserve_index=False), path, format="parquet", partitioning=partitioning,
+        basename_template=f"batch-{compiled_at.strftime('%Y%m%d_%H%M%S')}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore"
+    )
+    return len(batch)
+
+# Function to look up archived inspections by asset number, WO and/or inspection date range (datetimes, inclusive)
+def find_inspections(asset=None, wo=None, start=None, end=None, path=archive_dir):
+    dataset = open_archive(path)
+    if dataset is None:
+        return pd.DataFrame()
+
+    # WO and month filters only open the matching partition folders
+    conditions = []
+    if wo is not None:
+        conditions.append(ds.field("wo") == str(wo))
+    if start is not None:
+        conditions.append(ds.field("month") >= start.strftime("%Y-%m"))
+        conditions.append(ds.field("Inspection Date") >= pa.scalar(start, pa.timestamp("ns")))
+    if end is not None:
+        conditions.append(ds.field("month") <= end.strftime("%Y-%m"))
+        conditions.append(ds.field("Inspection Date") <= pa.scalar(end, pa.timestamp("ns")))
+    condition = None
+    for expression in conditions:
+        condition = expression if condition is None else condition & expression
+    results = dataset.to_table(filter=condition).to_pandas()
+    results["Uploaded Month"] = inspection_keys(results).map(upload_months(path)).fillna("")
+
+    # A row can hold several comma separated asset numbers
+    if asset is not None:
+        pattern = rf"(?:^|,)\s*{re.escape(str(asset))}\s*(?:,|$)"
+        results = results[results["Pipe Asset ID"].fillna("").str.contains(pattern)]
+    return results.sort_values(by=["Inspection Date", "JSA/WO"]).reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Look up archived NR CCI inspections.")
+    parser.add_argument("--asset", help="Pipe asset number")
+    parser.add_argument("--wo", help="JSA/WO number")
+    parser.add_argument("--from", dest="start", help="Earliest inspection date (dd/mm/yyyy)")
+    parser.add_argument("--to", dest="end", help="Latest inspection date (dd/mm/yyyy)")
+    parser.add_argument("--archive", default=archive_dir, help="Archive directory")
+    args = parser.parse_args()
+
+    if not (args.asset or args.wo or args.start or args.end):
+        parser.print_usage()
+        sys.exit(1)
+
+    start = datetime.strptime(args.start, "%d/%m/%Y") if args.start else None
+    end = datetime.strptime(args.end, "%d/%m/%Y") if args.end else None
+
+    started = time.perf_counter()
+    results = find_inspections(args.asset, args.wo, start, end, args.archive)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    if results.empty:
+        print("NO ARCHIVED INSPECTIONS FOUND")
+    else:
+        columns = ["JSA/WO", "Pipe Asset ID", "Date of inspection", "Time of inspection", "Attempt #", "Compiled Month", "Uploaded Month"]
+        print(results[columns].to_string(index=False))
+    print(f"\n{len(results)} inspection(s) found in {elapsed_ms:.0f} ms")
@@ -0,0 +1,69 @@
+# This module holds the inspection rules shared by NR&CCI_Compiler.py and NA&CCI_Web.py (the 10-hour filter and the values sent to Sydney Water), kept apart from the programs so they can be imported and tested without running them
+
+import numpy as np
+import pandas as pd
+
+# Inspections of the same JSA/WO closer together than this are treated as one inspection
+min_gap = np.timedelta64(10, 'h')
+
+# Columns derived from the source columns for the upload; the compiler writes them for QA to preview
+upload_headers = ["Upload Title", "Upload Tag", "Upload Priority Justification", "Upload Report Date", "Upload PDF Report Name"]
+
+priority_justification_values = ["CRIT", "CRCM", "MHIP", "WATW", "WACC", "WAEP", "WAER", "INTS", "ODOR", "ODCC", "MULT", "MULC", "OPER", "OPCC", "OPSC", "OPOH", "REPT", "RECC", "SALT", "SEEP", "SECC", "SUBX", "SUCC", "SUSC", "SUBS", "WETW", "WECC"]
+
+# Function to parse the inspection date and time columns into one datetime column
+def parse_inspection_datetime(df):
+    date_time = df['Date of inspection'].astype(str) + ' ' + df['Time of inspection'].astype(str)
+    parsed = pd.to_datetime(date_time, format='%d/%m/%Y %H:%M:%S', errors='coerce')
+    # Some sheets record the time without seconds
+    return parsed.fillna(pd.to_datetime(date_time, format='%d/%m/%Y %H:%M', errors='coerce'))
+
+# Function to remove inspections within the same JSA/WO that occur within a 10-hour span
+def remove_close_inspections(df):
+    df = df.assign(DateTime=parse_inspection_datetime(df))
+    # One stable sort puts every WO together with its latest inspection first
+    df = df.sort_values(by=['JSA/WO', 'DateTime'], ascending=[True, False], kind='mergesort').reset_index(drop=True)
+
+    # Single pass over the sorted rows: keep the first row of each WO, then every row at least 10 hours
+    # before the last kept row of that WO
+    date_times = df['DateTime'].to_numpy()
+    new_wo = df['JSA/WO'].ne(df['JSA/WO'].shift()).to_numpy()
+    keep_rows = np.zeros(len(df), dtype=bool)
+    last_kept = None
+    for i in range(len(df)):
+        if new_wo[i] or last_kept - date_times[i] >= min_gap:
+            keep_rows[i] = True
+            last_kept = date_times[i]
+
+    filtered_df = df[keep_rows].drop(columns=['DateTime']).reset_index(drop=True)
+    return filtered_df
+
+# Function to compute, for every row at once, the values the uploader sends to Sydney Water from the reviewed source columns
+def add_upload_columns(df):
+    df = df.copy()
+    # Empty cells read as "nan" in the uploader, so treat them the same way here
+    text = df.astype(object).where(df.notna(), "nan").astype(str)
+
+    # Entry title: "<Priority Justification>_<asset numbers>_<WO>_<Location Scamp>_<attempt>"
+    title1 = text["Priority Justification"].where(df["Priority Justification"].notna(), "")
+    asset_numbers = text["Pipe Asset ID"].str.replace(", ", "_", regex=False)
+    wo_number = pd.to_numeric(df["JSA/WO"], errors='coerce').astype("Int64").astype(str)
+    attempt = pd.to_numeric(df["Attempt #"], errors='coerce').astype("Int64").astype(str)
+    df["Upload Title"] = title1 + "_" + asset_numbers + "_" + wo_number + "_" + text["Location Scamp"] + "_" + attempt
+
+    # Check the cleaned field for "JJ" or "jj" to set the tags field
+    df["Upload Tag"] = np.where(text["Cleaning"].str.contains("JJ|jj"), "junctionjet", "cctv")
+
+    # Priority justifications outside the accepted codes are sent as "OTHER"
+    priority_pattern = "|".join(priority_justification_values)
+    df["Upload Priority Justification"] = np.where(text["Priority Justification"].str.contains(priority_pattern), text["Priority Justification"], "OTHER")
+
+    # Inspections done between midnight and 5:30 AM belong to the previous day's shift
+    inspection_time = pd.to_datetime(text["Time of inspection"], format='%H:%M:%S', errors='coerce')
+    inspection_time = inspection_time.fillna(pd.to_datetime(text["Time of inspection"], format='%H:%M', errors='coerce'))
+    inspection_date = pd.to_datetime(text["Date of inspection"], dayfirst=True, errors='coerce')
+    early_morning = (inspection_time - inspection_time.dt.normalize()) <= pd.Timedelta(hours=5, minutes=30)
+    report_date = inspection_date - pd.to_timedelta(early_morning.astype(int), unit='D')
+    df["Upload Report Date"] = report_date.dt.strftime('%d%m%Y')
+    df["Upload PDF Report Name"] = text["JSA/WO"] + " CCTV REPORT " + df["Upload Report Date"] + ".pdf"
+    return df
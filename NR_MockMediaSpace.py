@@ -0,0 +1,537 @@
+# This program runs a local stand-in for Sydney Water MediaSpace with the pages, element IDs and flows NA&CCI_Web.py relies on,
+# and benchmarks the uploader against it with synthetic rows so upload changes can be measured without the real site
+
+import os
+import re
+import sys
+import json
+import html
+import math
+import time
+import random
+import shutil
+import secrets
+import tempfile
+import argparse
+import threading
+import subprocess
+from datetime import datetime, timedelta
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+import pandas as pd
+import NR_UploadTrace
+
+# Directory paths
+uploader_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "NA&CCI_Web.py")
+
+cookie_name = "KMS_SESSION"
+
+# Behaviour of the mock site, set from the command line
+settings = {
+    "latency": 0.0,  # Seconds added to every request
+    "upload_speed": 0.0,  # MB/s the video and PDF uploads are throttled to (0 = unthrottled)
+    "session_minutes": 0.0,  # Minutes after which a login expires (0 = never)
+    "error_rate": 0.0,  # Chance that a page load fails with "503 Service Unavailable"
+    "fail_publish_rate": 0.0,  # Chance that the publish controls of an edit page never become clickable
+    "verbose": False,
+}
+failure_random = random.Random()
+
+# Everything the site holds, shared by the request threads
+state_lock = threading.Lock()
+sessions = {}  # Session token -> expiry time
+uploads = {}  # Upload token -> uploaded file
+entries = {}  # Entry ID -> entry
+
+# Every field of the "customdata" metadata profile: (ID, repeated)
+customdata_fields = [
+    ("ParentWorkOrderNumber0", False), ("ChildWorkOrderNumbers", True), ("WorkOrderDescription0", False),
+    ("AssetNumbers", True), ("TaskCode", False), ("Suburb0", False), ("AddressStreet0", False), ("Product0", False),
+    ("Contractor", False), ("UpstreamMH", False), ("DownstreamMH", False), ("DirectionOfSurvey", False),
+    ("DateOfCompletedInspection", False), ("TimeOfCompletedInspection", False), ("PackageName", False),
+    ("Cleaned0", False), ("SurveyedLength0", False), ("Location0", False), ("PriorityJustification", False)]
+
+# Function to decide whether to inject a failure with the given chance
+def inject(rate):
+    with state_lock:
+        return failure_random.random() < rate
+
+# Function to wrap a page body in the MediaSpace layout (the "Add New" menu is on every page once logged in)
+def page(title, body, logged_in=True):
+    header = ""
+    if logged_in:
+        header = """<div class="navbar">
+<button id="a11y-addNewDropDown" type="button" onclick="document.getElementById('addNewMenu').style.display = 'block';">Add New</button>
+<ul id="addNewMenu" style="display: none;"><li><a href="/upload/media">Media Upload</a></li></ul>
+</div>"""
+    return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{html.escape(title)} - MediaSpace (mock)</title></head>
+<body>
+{header}
+{body}
+</body></html>"""
+
+login_page = page("Login", """<h1>MediaSpace</h1>
+<button type="button" onclick="location.href = '/adfs/ls';">Sydney Water Staff</button>""", logged_in=False)
+
+sign_in_page = page("Sign In", """<h1>Sign in with your organisational account</h1>
+<form method="post" action="/adfs/ls">
+<input id="userNameInput" name="UserName" type="text">
+<input id="passwordInput" name="Password" type="password">
+<input id="submitButton" type="submit" value="Sign in">
+</form>""", logged_in=False)
+
+home_page = page("Home", "<h1>My Media</h1>")
+
+# Shared by the video and PDF uploads: post the chosen file and call back with its upload token
+upload_script = """function uploadFile(file, done) {
+    fetch('/api/upload?name=' + encodeURIComponent(file.name), {method: 'POST', body: file})
+        .then(function (response) { return response.json(); })
+        .then(function (upload) { done(upload.token); });
+}"""
+
+# Function to build the media upload page: choose a video, fill in the entry while it uploads, then save
+def upload_media_page():
+    fields = []
+    for field_id, repeated in customdata_fields:
+        if repeated:
+            fields.append(f"""<label>{field_id}</label>
+<div id="customdata-{field_id}"><input type="text" name="customdata[{field_id}][]"></div>
+<button type="button" id="customdata-{field_id}-addBtn" onclick="addField('{field_id}');">+</button>""")
+        else:
+            fields.append(f"""<label for="customdata-{field_id}">{field_id}</label>
+<input type="text" id="customdata-{field_id}" name="customdata[{field_id}]">""")
+    return page("Upload Media", f"""<h1>Upload Media</h1>
+<input type="file" id="fileinput">
+<div id="uploadStatus"></div>
+<div id="entryForm" style="display: none;">
+<label for="Entry-name">Name</label>
+<input type="text" id="Entry-name">
+<label>Description</label>
+<iframe class="wysihtml5-sandbox" srcdoc="&lt;body contenteditable=&quot;true&quot;&gt;&lt;/body&gt;"></iframe>
+<label>Tags</label>
+<ul id="tagList"></ul>
+<input type="text" id="s2id_autogen2">
+<div id="tagDrop" class="select2-drop" style="display: none;"><ul><li id="tagHighlighted" class="select2-highlighted"></li></ul></div>
+{chr(10).join(fields)}
+<button type="button" id="Entry-submit" onclick="saveEntry();">Save</button>
+<div id="saveStatus"></div>
+<a id="back" href="#" style="display: none;">Go to Media</a>
+</div>
+<script>
+{upload_script}
+var uploadToken = null;
+var tags = [];
+document.getElementById('fileinput').addEventListener('change', function () {{
+    document.getElementById('entryForm').style.display = 'block';
+    uploadFile(this.files[0], function (token) {{
+        uploadToken = token;
+        document.getElementById('uploadStatus').innerHTML = '<div class="alert alert-success"><strong>Upload Completed!</strong></div>';
+    }});
+}});
+var tagInput = document.getElementById('s2id_autogen2');
+var tagDrop = document.getElementById('tagDrop');
+tagInput.addEventListener('input', function () {{
+    document.getElementById('tagHighlighted').textContent = tagInput.value;
+    tagDrop.className = tagInput.value ? 'select2-drop select2-drop-active' : 'select2-drop';
+    tagDrop.style.display = tagInput.value ? 'block' : 'none';
+}});
+tagInput.addEventListener('keydown', function (event) {{
+    if (event.key === 'Enter' && tagInput.value) {{
+        event.preventDefault();
+        tags.push(tagInput.value);
+        var item = document.createElement('li');
+        item.textContent = tagInput.value;
+        document.getElementById('tagList').appendChild(item);
+        tagInput.value = '';
+        tagDrop.className = 'select2-drop';
+        tagDrop.style.display = 'none';
+    }}
+}});
+function addField(fieldId) {{
+    var input = document.createElement('input');
+    input.type = 'text';
+    input.name = 'customdata[' + fieldId + '][]';
+    document.getElementById('customdata-' + fieldId).appendChild(input);
+}}
+function saveEntry() {{
+    if (!uploadToken) {{
+        document.getElementById('saveStatus').textContent = 'The upload has not finished yet.';
+        return;
+    }}
+    var customdata = {{}};
+    document.querySelectorAll('input[name^="customdata["]').forEach(function (input) {{
+        var fieldId = input.name.slice('customdata['.length).split(']')[0];
+        if (input.name.slice(-2) === '[]') {{
+            (customdata[fieldId] = customdata[fieldId] || []).push(input.value);
+        }} else {{
+            customdata[fieldId] = input.value;
+        }}
+    }});
+    var entry = {{
+        upload: uploadToken,
+        name: document.getElementById('Entry-name').value,
+        description: document.querySelector('iframe.wysihtml5-sandbox').contentDocument.body.innerText,
+        tags: tags,
+        customdata: customdata
+    }};
+    fetch('/api/entry', {{method: 'POST', body: JSON.stringify(entry)}})
+        .then(function (response) {{
+            if (!response.ok) {{ throw new Error(response.status); }}
+            return response.json();
+        }})
+        .then(function (saved) {{
+            document.getElementById('saveStatus').textContent = 'Your changes have been saved.';
+            var back = document.getElementById('back');
+            back.href = '/media/' + saved.id;
+            back.style.display = 'inline';
+        }})
+        .catch(function (error) {{ document.getElementById('saveStatus').textContent = 'Saving failed (' + error.message + ').'; }});
+}}
+</script>""")
+
+# Function to build an entry's page, with the "Actions" menu leading to its edit page
+def media_page(entry):
+    return page(entry["name"], f"""<h1>{html.escape(entry["name"])}</h1>
+<button id="entryActionsMenuBtn" type="button" onclick="document.getElementById('actionsMenu').style.display = 'block';">Actions</button>
+<ul id="actionsMenu" style="display: none;"><li><a id="tab-Edit" href="/edit/{entry["id"]}">Edit</a></li></ul>""")
+
+# Function to build an entry's edit page with its attachments and publish tabs
+def edit_page(entry):
+    # An injected publish failure leaves the controls disabled, as when the publish tab never finishes loading
+    disabled = " disabled" if inject(settings["fail_publish_rate"]) else ""
+    attachments = "".join(f"<li>{html.escape(attachment['name'])}</li>" for attachment in entry["attachments"])
+    return page(f"Edit {entry['name']}", f"""<h1>Edit {html.escape(entry["name"])}</h1>
+<ul class="nav nav-tabs">
+<li><a id="attachments-tab-tab" href="#attachments" onclick="showTab('attachments'); return false;">Attachments</a></li>
+<li><a id="Publish-tab" href="#publish" onclick="showTab('publish'); return false;">Publish</a></li>
+</ul>
+<div id="attachments" class="tab-pane" style="display: none;">
+<a class="btn btn-primary" href="/attachments/index/add/entryid/{entry["id"]}" onclick="openAttachment(); return false;">Upload file</a>
+<ul id="attachmentList">{attachments}</ul>
+</div>
+<div id="attachmentModal" style="display: none;">
+<input type="file" id="attachments_fileinput">
+<a class="btn attachment-save-btn btn-primary disabled" href="#" onclick="saveAttachment(this); return false;">Save</a>
+</div>
+<div id="publish" class="tab-pane" style="display: none;">
+<input type="radio" name="publishStatus" id="private_entry" value="private" checked> Private
+<input type="radio" name="publishStatus" id="published_entry" value="published"{disabled}> Published
+<input type="checkbox" id="CategoryTree-214" value="1"{disabled}> COMDAININF-001
+<button type="button" class="btn btn-primary pblSave" onclick="publish();">Save</button>
+<div id="publishStatus"></div>
+</div>
+<script>
+{upload_script}
+var attachmentToken = null;
+var attachmentSave = document.querySelector('.attachment-save-btn');
+function showTab(tabId) {{
+    document.querySelectorAll('.tab-pane').forEach(function (pane) {{ pane.style.display = 'none'; }});
+    document.getElementById(tabId).style.display = 'block';
+}}
+function openAttachment() {{
+    document.getElementById('attachmentModal').style.display = 'block';
+}}
+document.getElementById('attachments_fileinput').addEventListener('change', function () {{
+    uploadFile(this.files[0], function (token) {{
+        attachmentToken = token;
+        attachmentSave.classList.remove('disabled');
+    }});
+}});
+function saveAttachment(button) {{
+    if (button.classList.contains('disabled')) {{ return; }}
+    fetch('/api/entry/{entry["id"]}/attachment', {{method: 'POST', body: JSON.stringify({{upload: attachmentToken}})}})
+        .then(function (response) {{ return response.json(); }})
+        .then(function (attachment) {{
+            var item = document.createElement('li');
+            item.textContent = attachment.name;
+            document.getElementById('attachmentList').appendChild(item);
+            document.getElementById('attachmentModal').style.display = 'none';
+        }});
+}}
+function publish() {{
+    // Saved before the click returns, so leaving the page straight afterwards cannot cancel it
+    var request = new XMLHttpRequest();
+    request.open('POST', '/api/entry/{entry["id"]}/publish', false);
+    request.send(JSON.stringify({{
+        published: document.getElementById('published_entry').checked,
+        categories: document.getElementById('CategoryTree-214').checked ? [214] : []
+    }}));
+    document.getElementById('publishStatus').textContent = request.status === 200 ? 'Your changes have been saved.' : 'Saving failed.';
+}}
+</script>""")
+
+
+# Serves the mock site; every request runs on its own thread like the browser sessions that send them
+class MockMediaSpaceHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        if settings["verbose"]:
+            super().log_message(format, *args)
+
+    def send_body(self, status, body, content_type="text/html; charset=utf-8"):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_json(self, status, value):
+        self.send_body(status, json.dumps(value), "application/json")
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def session_token(self):
+        cookie = SimpleCookie(self.headers.get("Cookie") or "")
+        return cookie[cookie_name].value if cookie_name in cookie else None
+
+    # Pages need a login that has not expired; calls made by a page that is already open only need a known session
+    def session_valid(self, allow_expired=False):
+        with state_lock:
+            expires = sessions.get(self.session_token())
+        return expires is not None and (allow_expired or time.time() < expires)
+
+    def find_entry(self, entry_id):
+        with state_lock:
+            return entries.get(entry_id)
+
+    def do_GET(self):
+        time.sleep(settings["latency"])
+        path = urlparse(self.path).path
+        if path == "/adfs/ls":
+            return self.send_body(200, sign_in_page)
+        if path == "/api/state":
+            with state_lock:
+                return self.send_json(200, {"entries": list(entries.values())})
+        if not self.session_valid():
+            return self.send_body(200, login_page)
+        if inject(settings["error_rate"]):
+            return self.send_body(503, page("Error", "<h1>Service Unavailable</h1>"))
+
+        match = re.fullmatch(r"/(media|edit)/([\w-]+)", path)
+        if path == "/":
+            self.send_body(200, home_page)
+        elif path == "/upload/media":
+            self.send_body(200, upload_media_page())
+        elif match and self.find_entry(match.group(2)):
+            entry = self.find_entry(match.group(2))
+            self.send_body(200, media_page(entry) if match.group(1) == "media" else edit_page(entry))
+        else:
+            self.send_body(404, page("Not Found", "<h1>Not Found</h1>"))
+
+    def do_POST(self):
+        time.sleep(settings["latency"])
+        path = urlparse(self.path).path
+        if path == "/adfs/ls":
+            # Any user name and password is accepted
+            self.read_body()
+            token = secrets.token_hex(16)
+            with state_lock:
+                sessions[token] = time.time() + settings["session_minutes"] * 60 if settings["session_minutes"] else math.inf
+            self.send_response(302)
+            self.send_header("Location", "/")
+            self.send_header("Set-Cookie", f"{cookie_name}={token}; Path=/")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if not self.session_valid(allow_expired=True):
+            return self.send_json(401, {"error": "Not logged in"})
+
+        match = re.fullmatch(r"/api/entry/([\w-]+)/(attachment|publish)", path)
+        if path == "/api/upload":
+            self.receive_upload()
+        elif path == "/api/entry":
+            self.create_entry(json.loads(self.read_body()))
+        elif match and self.find_entry(match.group(1)):
+            entry = self.find_entry(match.group(1))
+            request = json.loads(self.read_body())
+            if match.group(2) == "attachment":
+                self.add_attachment(entry, request)
+            else:
+                self.publish_entry(entry, request)
+        else:
+            self.send_json(404, {"error": "Not found"})
+
+    # Reads an uploaded file in chunks, throttled to the configured upload speed
+    def receive_upload(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        started = time.perf_counter()
+        received = 0
+        while received < length:
+            chunk = self.rfile.read(min(256 * 1024, length - received))
+            if not chunk:
+                break
+            received += len(chunk)
+            if settings["upload_speed"]:
+                ahead = received / (settings["upload_speed"] * 1e6) - (time.perf_counter() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+        query = dict(part.split("=", 1) for part in urlparse(self.path).query.split("&") if "=" in part)
+        token = secrets.token_hex(8)
+        with state_lock:
+            uploads[token] = {"name": query.get("name", ""), "bytes": received, "seconds": round(time.perf_counter() - started, 3)}
+        self.send_json(200, {"token": token})
+
+    def create_entry(self, request):
+        with state_lock:
+            upload = uploads.get(request.get("upload"))
+            if upload is None:
+                return self.send_json(400, {"error": "Unknown upload"})
+            entry_id = f"1_{len(entries) + 1:08x}"
+            entries[entry_id] = {
+                "id": entry_id,
+                "name": request.get("name", ""),
+                "description": request.get("description", ""),
+                "tags": request.get("tags", []),
+                "customdata": request.get("customdata", {}),
+                "video": upload,
+                "attachments": [],
+                "published": False,
+                "categories": [],
+                "created": datetime.now().isoformat(timespec='seconds'),
+                "published_at": None,
+            }
+        self.send_json(200, {"id": entry_id})
+
+    def add_attachment(self, entry, request):
+        with state_lock:
+            upload = uploads.get(request.get("upload"))
+            if upload is None:
+                return self.send_json(400, {"error": "Unknown upload"})
+            entry["attachments"].append(upload)
+        self.send_json(200, upload)
+
+    def publish_entry(self, entry, request):
+        with state_lock:
+            entry["published"] = bool(request.get("published"))
+            entry["categories"] = request.get("categories", [])
+            entry["published_at"] = datetime.now().isoformat(timespec='seconds') if entry["published"] else None
+        self.send_json(200, {"id": entry["id"], "published": entry["published"]})
+
+
+# Function to start the mock site on a background thread (port 0 picks a free port); returns the server and its address
+def start_server(host="127.0.0.1", port=0):
+    server = ThreadingHTTPServer((host, port), MockMediaSpaceHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock_mediaspace", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/"
+
+
+# Function to lay out synthetic job folders and the reviewed Excel file the uploader expects below an uploads root
+def write_synthetic_rows(uploads_root, row_count, rows_per_job, video_mb):
+    pending_dir = os.path.join(uploads_root, "PENDING")
+    os.makedirs(os.path.join(pending_dir, "EXCEL COPIES"), exist_ok=True)
+    os.makedirs(os.path.join(uploads_root, "PDF REPORTS"), exist_ok=True)
+
+    inspection_date = datetime.now() - timedelta(days=1)
+    rows = []
+    for position in range(row_count):
+        job = position // rows_per_job
+        wo = 91000000 + job
+        job_dir = os.path.join(pending_dir, f"BENCH_{wo}")
+        video_dir = os.path.join(job_dir, "Video", "Sec")
+        docu_dir = os.path.join(job_dir, "misc", "docu")
+        os.makedirs(video_dir, exist_ok=True)
+        os.makedirs(docu_dir, exist_ok=True)
+
+        # Random contents, so the ledger sees every video as a different inspection
+        video_path = os.path.join(video_dir, f"{wo}_{position:04d}.mp4")
+        with open(video_path, 'wb') as f:
+            f.write(os.urandom(int(video_mb * 1024 * 1024)))
+        pdf_path = os.path.join(docu_dir, f"{wo}.pdf")
+        if not os.path.exists(pdf_path):
+            with open(pdf_path, 'wb') as f:
+                f.write(b"%PDF-1.4\n%" + os.urandom(64 * 1024) + b"\n%%EOF\n")
+
+        asset = str(5000000 + position)
+        report_date = inspection_date.strftime('%d%m%Y')
+        tag = "junctionjet" if position % 2 else "cctv"
+        rows.append({
+            "Attempt #": 1, "Inspection Video(s)": video_path, "US MH": f"MH{position:04d}", "DS MH": f"MH{position + 1:04d}",
+            "Inspection Direction": "Downstream", "Date of inspection": inspection_date.strftime('%d/%m/%Y'),
+            "Time of inspection": f"{8 + position % 10:02d}:{position % 60:02d}:00", "PackageName": "BENCHMARK",
+            "Cleaning": "JJ" if tag == "junctionjet" else "No", "Inspected Length [m]": 25.5, "Pipe Asset ID": asset,
+            "JSA/WO": wo, "Child WO": str(wo + 500000), "General comment": "Synthetic benchmark inspection",
+            "Section PDF Filename": pdf_path, "Address/Location": f"{position + 1} Benchmark St", "Suburb": "PARRAMATTA",
+            "Client Defined 2": "", "WO description": "Benchmark CCTV", "Location Scamp": "PARR", "Priority Justification": "CRIT",
+            "Operational Area": "West", "Task code": "CCTV",
+            "Upload Title": f"CRIT_{asset}_{wo}_PARR_1", "Upload Tag": tag, "Upload Priority Justification": "CRIT",
+            "Upload Report Date": report_date, "Upload PDF Report Name": f"{wo} CCTV REPORT {report_date}.pdf",
+        })
+    pd.DataFrame(rows).to_excel(os.path.join(pending_dir, "compiled_data.xlsx"), index=False)
+    return rows
+
+# Function to run the uploader against the mock site with synthetic rows and report the rows uploaded per hour
+def run_benchmark(bench_args, uploader_args):
+    workspace = bench_args.workspace or tempfile.mkdtemp(prefix="nr_cci_bench_")
+    print(f"Writing {bench_args.rows} synthetic row(s) of {bench_args.video_mb} MB to '{workspace}'...")
+    write_synthetic_rows(workspace, bench_args.rows, bench_args.rows_per_job, bench_args.video_mb)
+
+    server, base_url = start_server()
+    print(f"Mock MediaSpace running at {base_url}")
+    command = [sys.executable, uploader_file_path, "--root", workspace, "--base-url", base_url,
+               "--session-cache", bench_args.session_cache or os.path.join(workspace, "session_cache"),
+               "--sessions", str(bench_args.sessions)] + uploader_args
+    started = time.perf_counter()
+    result = subprocess.run(command)
+    wall_seconds = time.perf_counter() - started
+    server.shutdown()
+
+    with state_lock:
+        created = list(entries.values())
+    published = [entry for entry in created if entry["published"] and 214 in entry["categories"] and entry["attachments"]]
+    print(f"\nUploader exit code: {result.returncode}")
+    print(f"Rows: {bench_args.rows}, entries created: {len(created)}, published with PDF and category: {len(published)}")
+    print(f"Wall time: {wall_seconds:.1f} s")
+    print(f"Rows/hour: {len(published) * 3600 / wall_seconds:.1f}")
+
+    trace_file_path = os.path.join(workspace, "upload_trace.jsonl")
+    if os.path.exists(trace_file_path):
+        print()
+        NR_UploadTrace.print_summary(NR_UploadTrace.read_traces([trace_file_path]))
+    if bench_args.keep:
+        print(f"\nBenchmark files kept in '{workspace}'.")
+    else:
+        shutil.rmtree(workspace, ignore_errors=True)
+    return result.returncode
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for Sydney Water MediaSpace, and a benchmark of NA&CCI_Web.py against it.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request (default: 0)")
+    parser.add_argument("--upload-speed", type=float, default=0.0, help="MB/s uploads are throttled to (default: unthrottled)")
+    parser.add_argument("--session-minutes", type=float, default=0.0, help="Minutes after which a login expires (default: never)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Chance (0-1) that a page load fails with 503")
+    parser.add_argument("--fail-publish-rate", type=float, default=0.0, help="Chance (0-1) that the publish controls of an edit page stay disabled")
+    parser.add_argument("--seed", type=int, help="Seed for the injected failures, to repeat a run")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    modes = parser.add_subparsers(dest="mode", required=True)
+    serve_parser = modes.add_parser("serve", help="Run the mock site until stopped")
+    serve_parser.add_argument("--port", type=int, default=8080, help="Port to listen on (default: 8080)")
+    bench_parser = modes.add_parser("bench", help="Run the uploader against the mock site; options it does not know are passed on to the uploader")
+    bench_parser.add_argument("--rows", type=int, default=10, help="Number of synthetic rows (default: 10)")
+    bench_parser.add_argument("--rows-per-job", type=int, default=5, help="Rows per synthetic job folder (default: 5)")
+    bench_parser.add_argument("--video-mb", type=float, default=5, help="Size of each synthetic video in MB (default: 5)")
+    bench_parser.add_argument("--sessions", type=int, default=1, help="Browser sessions of the uploader (default: 1)")
+    bench_parser.add_argument("--workspace", help="Folder for the synthetic uploads root (default: a new temporary folder)")
+    bench_parser.add_argument("--session-cache", help="Chromedriver and browser profile folder for the uploader (default: inside the workspace)")
+    bench_parser.add_argument("--keep", action="store_true", help="Keep the workspace afterwards")
+    args, uploader_args = parser.parse_known_args()
+
+    settings.update(latency=args.latency, upload_speed=args.upload_speed, session_minutes=args.session_minutes,
+                    error_rate=args.error_rate, fail_publish_rate=args.fail_publish_rate, verbose=args.verbose)
+    failure_random.seed(args.seed)
+
+    if args.mode == "serve":
+        if uploader_args:
+            parser.error(f"unrecognized arguments: {' '.join(uploader_args)}")
+        server = ThreadingHTTPServer(("127.0.0.1", args.port), MockMediaSpaceHandler)
+        print(f"Mock MediaSpace running at http://127.0.0.1:{args.port}/ (Ctrl+C to stop)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    else:
+        sys.exit(run_benchmark(args, uploader_args))
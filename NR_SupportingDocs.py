@@ -1,11 +1,13 @@
 # This program transfers and appropriately names all supporting documents for all jobs completed under the NR contract, to be submitted for monthly claim.
 
-import pandas as pd
+import openpyxl
 import os
 import shutil
 import re
-import sys
+import json
 import warnings
+import argparse
+import threading
 from datetime import datetime
 import Levenshtein
 from concurrent.futures import ThreadPoolExecutor, as_completed
@@ -13,6 +15,34 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 # Suppress specific warnings
 warnings.filterwarnings("ignore", category=UserWarning, module='openpyxl')
 
+# Directory paths
+timesheets_dir = r"C:\Users\JulianNorman\Dropbox (Pipe Management Aus)\Operations\Scanned Timesheets\Sydney Water Contract"
+pdf_reports_dir = r"F:\NR CCI UPLOADS\PDF REPORTS"
+
+# In-memory index of the scanned timesheet folders, built by index_timesheets before the sheet threads start and only read
+# by them: year -> entries of <year>\NR, and (year, month folder) -> {date folder: [(file name, path), ...]}
+year_folders = {}
+date_folder_files = {}
+
+# BK-tree over every whitespace separated segment of the scanned timesheet names, built together with the folder index,
+# to find the segments within a few edits of a job number without comparing it to each one. Node: [segment, {distance: child}]
+segment_tree = None
+indexed_segments = set()
+
+# Copies share a separate, smaller limit than the sheet threads, so the Dropbox and F: disks are not read by every thread at once
+io_workers = 2
+io_slots = threading.BoundedSemaphore(io_workers)
+link_files = False
+transfer_lock = threading.Lock()
+transfer_totals = {"copied": [0, 0], "linked": [0, 0], "skipped": [0, 0]}  # files, bytes
+
+# Every planned action and warning is written to this file in the output folder before anything is copied
+manifest_file_name = "supporting_docs_manifest.json"
+
+# PDF REPORTS, scanned once at startup: filename token -> [(file name, path), ...]
+pdf_reports_by_token = {}
+pdf_report_files = []
+
 def create_folder(folder_path):
     if not os.path.exists(folder_path):
         os.makedirs(folder_path)
@@ -37,95 +67,373 @@ def rename_file(original_path, new_folder_path, sheet_name):
     new_path = os.path.join(new_folder_path, new_name + ext)
     return new_path
 
-def is_close_match(a, b, max_distance=2):
-    if Levenshtein.distance(a, b) <= max_distance:
-        return True
-    return False
+# Function to list every file below a folder as (file name, path), with one os.scandir per folder
+def scan_files(folder_path):
+    files = []
+    folders = [folder_path]
+    while folders:
+        with os.scandir(folders.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    folders.append(entry.path)
+                else:
+                    files.append((entry.name, entry.path))
+    return files
+
+# Function to split a filename into its letter/number tokens
+def filename_tokens(file_name):
+    return [token for token in re.split(r'[^0-9A-Za-z]+', os.path.splitext(file_name)[0]) if token]
+
+# Function to get the job sheet's inspection dates (dd.mm.yyyy) from its B9 cell
+def record_dates(record):
+    return [convert_date_format(date) for date in extract_dates(record["B9"].strip())]
+
+# Function to get a date's (dd.mm.yyyy) year and the month name its month folders contain
+def date_month(date):
+    day = datetime.strptime(date, "%d.%m.%Y")
+    return day.strftime("%Y"), day.strftime("%B")
+
+# Function to scan the date folders of a month folder: {date folder: [(file name, path), ...]}
+def scan_month_folder(month_folder_path):
+    with os.scandir(month_folder_path) as entries:
+        return {entry.name: scan_files(entry.path) for entry in entries if entry.is_dir()}
+
+# Function to index the timesheet folders of every month the given dates (dd.mm.yyyy) fall in, and build the segment BK-tree
+def index_timesheets(dates):
+    months = sorted({date_month(date) for date in dates})
+    for year, _ in months:
+        if year not in year_folders:
+            year_folders[year] = os.listdir(os.path.join(timesheets_dir, year, "NR"))
+    month_folders = sorted({(year, folder) for year, month_name in months for folder in year_folders[year] if month_name in folder})
+
+    # The month folders are scanned at the same time (mostly waiting on Dropbox), the tree is then built in one thread
+    with ThreadPoolExecutor() as executor:
+        scanned = executor.map(lambda key: scan_month_folder(os.path.join(timesheets_dir, key[0], "NR", key[1])), month_folders)
+        date_folder_files.update(zip(month_folders, scanned))
+    for key in month_folders:
+        for folder_files in date_folder_files[key].values():
+            for file, _ in folder_files:
+                for segment in file.split():
+                    add_segment(segment)
+
+# Function to get every scanned timesheet file for a date (dd.mm.yyyy) from the date folders of its month
+def timesheet_files(date):
+    year, month_name = date_month(date)
+    files = []
+    for folder in year_folders[year]:
+        if month_name in folder:
+            files.extend(date_folder_files[(year, folder)].get(date, []))
+    return files
+
+# Function to build the PDF REPORTS index
+def index_pdf_reports():
+    if os.path.exists(pdf_reports_dir):
+        pdf_report_files.extend(scan_files(pdf_reports_dir))
+    for file_name, file_path in pdf_report_files:
+        for token in set(filename_tokens(file_name)):
+            pdf_reports_by_token.setdefault(token, []).append((file_name, file_path))
+
+# Function to add a filename segment to the BK-tree
+def add_segment(segment):
+    global segment_tree
+    if segment in indexed_segments:
+        return
+    indexed_segments.add(segment)
+    if segment_tree is None:
+        segment_tree = [segment, {}]
+        return
+    node = segment_tree
+    while True:
+        distance = Levenshtein.distance(segment, node[0])
+        if distance not in node[1]:
+            node[1][distance] = [segment, {}]
+            return
+        node = node[1][distance]
+
+# Function to find every indexed segment within max_distance edits of a word. Only children whose distance to their
+# parent is within max_distance of the word's distance to that parent can hold a match
+def close_segments(word, max_distance=2):
+    matches = set()
+    nodes = [segment_tree] if segment_tree is not None else []
+    while nodes:
+        segment, children = nodes.pop()
+        distance = Levenshtein.distance(word, segment)
+        if distance <= max_distance:
+            matches.add(segment)
+        for child_distance, child in children.items():
+            if distance - max_distance <= child_distance <= distance + max_distance:
+                nodes.append(child)
+    return matches
+
+
+# Function to copy a file's contents, with copy_file_range (copied inside the filesystem, no round trip through Python)
+# where the platform has it and both files are on the same filesystem
+def copy_contents(source, destination, same_device):
+    if same_device and hasattr(os, "copy_file_range"):
+        try:
+            with open(source, 'rb') as fsrc, open(destination, 'wb') as fdst:
+                remaining = os.fstat(fsrc.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+            return
+        except OSError:
+            pass  # Not supported by this filesystem, copy normally
+    shutil.copyfile(source, destination)
+
+# Function to bring a file to its destination: skipped if an identical copy (same size and modified time) is already
+# there, hard linked when --link is given and both are on the same filesystem, otherwise copied with its timestamps
+def transfer_file(source, destination):
+    source_stat = os.stat(source)
+    try:
+        destination_stat = os.stat(destination)
+    except FileNotFoundError:
+        destination_stat = None
+
+    # Modified times are compared to within 2 seconds, the resolution of FAT formatted drives
+    if destination_stat is not None and (os.path.samestat(source_stat, destination_stat) or (
+            destination_stat.st_size == source_stat.st_size and abs(destination_stat.st_mtime - source_stat.st_mtime) <= 2)):
+        kind = "skipped"
+    else:
+        same_device = os.stat(os.path.dirname(destination)).st_dev == source_stat.st_dev
+        with io_slots:
+            kind = "copied"
+            if link_files and same_device:
+                try:
+                    if destination_stat is not None:
+                        os.remove(destination)
+                    os.link(source, destination)
+                    kind = "linked"
+                except OSError:
+                    pass  # Links not allowed here, copy instead
+            if kind == "copied":
+                copy_contents(source, destination, same_device)
+                shutil.copystat(source, destination)
+
+    with transfer_lock:
+        transfer_totals[kind][0] += 1
+        transfer_totals[kind][1] += source_stat.st_size
+
+# Function to show a number of bytes in MB
+def megabytes(size):
+    return f"{size / (1024 * 1024):.1f} MB"
+
+
+def find_pdf_reports(sheet_name, new_folder_path):
+    # Report names start with the job number as a whole token ("<WO> CCTV REPORT <date>.pdf"), so a job number is a
+    # dictionary hit; other sheet names are matched against the scanned names in memory
+    if filename_tokens(sheet_name) == [sheet_name]:
+        matches = pdf_reports_by_token.get(sheet_name, [])
+    else:
+        matches = [(file, file_path) for file, file_path in pdf_report_files if sheet_name in file]
+    return [(file_path, os.path.join(new_folder_path, file)) for file, file_path in matches]
 
 
-def search_and_copy_files(search_path, sheet_name, new_folder_path):    
-    for root, _, files in os.walk(search_path):
-        for file in files:
-            if sheet_name in file:
-                file_path = os.path.join(root, file)
-                new_file_path = os.path.join(new_folder_path, file)
-                shutil.copy2(file_path, new_file_path)
+# Function to read the cells each job sheet needs (B5, B6 and B9) from every job sheet in a single read-only pass
+# A cell below the last row of its sheet is left out of the sheet's record
+def read_job_records(excel_path):
+    wb = openpyxl.load_workbook(excel_path, read_only=True, data_only=True)
+    records = []
+    try:
+        for sheet_name in wb.sheetnames[2:]:
+            record = {"sheet_name": sheet_name}
+            for row_number, (value,) in enumerate(wb[sheet_name].iter_rows(min_row=5, max_row=9, min_col=2, max_col=2, values_only=True), start=5):
+                record[f"B{row_number}"] = value
+            records.append(record)
+    finally:
+        wb.close()
+    return records
 
 
-def process_sheet(excel_path, sheet_name, output_folder):
-    df = pd.read_excel(excel_path, sheet_name=sheet_name)
+# Function to work out, without copying anything, a sheet's job folder, the files to bring into it and its warnings
+def plan_sheet(record, output_folder):
+    sheet_name = record["sheet_name"]
+    new_folder_path = None
+    actions = []
+    messages = []
 
     try:
-        value_B6 = df.iloc[4, 1].strip()
-        value_B5 = df.iloc[3, 1].strip()
+        value_B6 = record["B6"].strip()
+        value_B5 = record["B5"].strip()
         new_folder_name = f"{sheet_name.strip()} {value_B6}, {value_B5}"
         new_folder_path = os.path.join(output_folder, new_folder_name)
-        create_folder(new_folder_path)
 
-        date_string = df.iloc[7, 1].strip()
-        dates = extract_dates(date_string)
-        converted_dates = [convert_date_format(date) for date in dates]
-
-        for date in converted_dates:
+        for date in record_dates(record):
             files_found = False
-            month_name = datetime.strptime(date, "%d.%m.%Y").strftime("%B")
-            year = datetime.strptime(date, "%d.%m.%Y").strftime("%Y")
-            parent_folder = os.path.join(
-                r"C:\Users\JulianNorman\Dropbox (Pipe Management Aus)\Operations\Scanned Timesheets\Sydney Water Contract",
-                year, "NR"
-            )
-
-            for folder in os.listdir(parent_folder):
-                if month_name in folder:
-                    month_folder_path = os.path.join(parent_folder, folder)
-                    if any(date in subfolder for subfolder in os.listdir(month_folder_path)):
-                        date_folder_path = os.path.join(month_folder_path, date)
-
-                        if os.path.exists(date_folder_path):
-                            for root, _, files in os.walk(date_folder_path):
-                                for file in files:
-                                    if str(sheet_name).strip() in file:
-                                        files_found = True
-                                        file_path = os.path.join(root, file)
-                                        if not os.path.exists(new_folder_path):
-                                            os.makedirs(new_folder_path)
-                                        new_file_path = rename_file(file_path, new_folder_path, sheet_name)
-                                        shutil.copy2(file_path, new_file_path)
-                                    else:
-                                        filename_segments = file.split()
-                                        for segment in filename_segments:
-                                            if is_close_match(sheet_name.strip(), segment):
-                                                print(f"WARNING -- POSSIBLE MATCH FOR {sheet_name} ON {date}: {file} (Segment: {segment})")
-                                                break
+            date_files = timesheet_files(date)
+            possible_matches = close_segments(sheet_name.strip())
+            for file, file_path in date_files:
+                if str(sheet_name).strip() in file:
+                    files_found = True
+                    new_file_path = rename_file(file_path, new_folder_path, sheet_name)
+                    actions.append({"sheet": sheet_name, "date": date, "source": file_path, "destination": new_file_path})
+                else:
+                    filename_segments = file.split()
+                    for segment in filename_segments:
+                        if segment in possible_matches:
+                            messages.append(f"WARNING -- POSSIBLE MATCH FOR {sheet_name} ON {date}: {file} (Segment: {segment})")
+                            break
 
             if not files_found:
-                print(f"WARNING -- NO FILES FOUND FOR {sheet_name} ON {date}")
+                messages.append(f"WARNING -- NO FILES FOUND FOR {sheet_name} ON {date}")
 
         # Search and copy files from the additional directory
-        search_path = r"F:\NR CCI UPLOADS\PDF REPORTS"
-        search_and_copy_files(search_path, sheet_name, new_folder_path)
+        for file_path, new_file_path in find_pdf_reports(sheet_name, new_folder_path):
+            actions.append({"sheet": sheet_name, "date": None, "source": file_path, "destination": new_file_path})
 
     except KeyError as e:
-        print(f"KeyError: {e} - Check if the cell references are correct in sheet {sheet_name}")
+        messages.append(f"KeyError: {e} - Check if the cell references are correct in sheet {sheet_name}")
     except IndexError as e:
-        print(f"IndexError: {e} - Check if the cell references are correct in sheet {sheet_name}")
+        messages.append(f"IndexError: {e} - Check if the cell references are correct in sheet {sheet_name}")
+    return new_folder_path, actions, messages
+
+# Function to plan every job sheet of the workbook into one manifest
+def plan(excel_path, output_folder):
+    # The workbook is parsed once here; the sheet threads only work on the cells read from it
+    job_records = read_job_records(excel_path)
+    index_pdf_reports()
 
-def main(excel_path, output_folder):
-    excel_data = pd.ExcelFile(excel_path)
+    # The timesheet folders and the BK-tree are built before the sheet threads start, so the threads only read them
+    dates = set()
+    for record in job_records:
+        try:
+            dates.update(record_dates(record))
+        except KeyError:
+            pass  # Reported by plan_sheet
+    index_timesheets(dates)
 
     with ThreadPoolExecutor() as executor:
-        futures = [executor.submit(process_sheet, excel_path, sheet_name, output_folder) for sheet_name in excel_data.sheet_names[2:]]
-        for future in as_completed(futures):
-            future.result()  # Ensure all threads complete
+        results = list(executor.map(lambda record: plan_sheet(record, output_folder), job_records))
+
+    folders = [new_folder_path for new_folder_path, _, _ in results if new_folder_path is not None]
+    actions = [action for _, sheet_actions, _ in results for action in sheet_actions]
+    messages = [message for _, _, sheet_messages in results for message in sheet_messages]
+
+    destinations = {}
+    for action in actions:
+        destinations.setdefault(action["destination"], []).append(action["source"])
+    for destination, sources in destinations.items():
+        if len(sources) > 1:
+            messages.append(f"WARNING -- {destination} IS PLANNED FROM {len(sources)} FILES: {', '.join(sources)}")
+
+    # Disk order: sorted by source path, so each source folder is read once, front to back
+    actions.sort(key=lambda action: (action["source"].lower(), action["destination"].lower()))
+    for number, action in enumerate(actions):
+        action["id"] = number
+    return {
+        "created": datetime.now().isoformat(timespec='seconds'),
+        "excel_path": excel_path,
+        "output_folder": output_folder,
+        "folders": folders,
+        "actions": actions,
+        "warnings": messages,
+    }
+
+# Function to write a manifest, replacing any earlier one (and its progress) in one step
+def save_manifest(manifest, manifest_path):
+    temp_path = manifest_path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(temp_path, manifest_path)
+    if os.path.exists(progress_file_path(manifest_path)):
+        os.remove(progress_file_path(manifest_path))
 
+# Function to get the file the finished actions of a manifest are recorded in
+def progress_file_path(manifest_path):
+    return os.path.splitext(manifest_path)[0] + "_progress.jsonl"
+
+# Function to copy one batch of actions (all from the same source folder) in order, recording each finished one
+def run_batch(batch, progress_file, failed_actions):
+    for action in batch:
+        try:
+            transfer_file(action["source"], action["destination"])
+        except OSError as e:
+            print(f"WARNING -- COULD NOT COPY {action['source']} TO {action['destination']}: {e}")
+            with transfer_lock:
+                failed_actions.append(action)
+            continue
+        # Flushed but not synced: an action lost in a crash is redone, and finds its copy unchanged
+        with transfer_lock:
+            progress_file.write(json.dumps({"done": action["id"]}) + "\n")
+            progress_file.flush()
+
+# Function to carry out a manifest, skipping the actions an earlier (stopped) run already finished
+def execute(manifest, manifest_path):
+    done_ids = set()
+    if os.path.exists(progress_file_path(manifest_path)):
+        with open(progress_file_path(manifest_path), 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    done_ids.add(json.loads(line)["done"])
+                except (ValueError, KeyError):
+                    pass  # A line cut short by a crash
+    pending_actions = [action for action in manifest["actions"] if action["id"] not in done_ids]
+    if done_ids:
+        print(f"Resuming: {len(manifest['actions']) - len(pending_actions)} of {len(manifest['actions'])} file(s) were already done.")
+
+    for folder in manifest["folders"]:
+        create_folder(folder)
+
+    # One batch per source folder; the batches share the --io-workers limit
+    batches = {}
+    for action in pending_actions:
+        batches.setdefault(os.path.dirname(action["source"]), []).append(action)
+    failed_actions = []
+    with open(progress_file_path(manifest_path), 'a', encoding='utf-8') as progress_file:
+        with ThreadPoolExecutor(max_workers=io_workers) as executor:
+            futures = [executor.submit(run_batch, batch, progress_file, failed_actions) for batch in batches.values()]
+            for future in as_completed(futures):
+                future.result()  # Ensure all threads complete
+
+    for kind in ["copied", "linked", "skipped"]:
+        files, size = transfer_totals[kind]
+        print(f"{kind.upper()}: {files} file(s), {megabytes(size)}")
+    if failed_actions:
+        print(f"WARNING -- {len(failed_actions)} FILE(S) COULD NOT BE COPIED. FIX THE CAUSE AND RUN AGAIN WITH --execute \"{manifest_path}\" TO COPY ONLY THOSE.")
+
+# Function to set the copy limit and link mode for this run
+def configure_transfers(workers, link):
+    global io_slots, io_workers, link_files
+    io_workers = max(1, workers)
+    io_slots = threading.BoundedSemaphore(io_workers)
+    link_files = link
+
+def main(excel_path, output_folder, io_workers=2, link=False, plan_only=False, manifest_path=None):
+    configure_transfers(io_workers, link)
+    create_folder(output_folder)
+    manifest_path = manifest_path or os.path.join(output_folder, manifest_file_name)
+
+    manifest = plan(excel_path, output_folder)
+    for message in manifest["warnings"]:
+        print(message)
+    save_manifest(manifest, manifest_path)
+    print(f"Planned {len(manifest['actions'])} file(s) into {len(manifest['folders'])} job folder(s). Manifest saved to '{manifest_path}'.")
+    if plan_only:
+        return
+
+    execute(manifest, manifest_path)
     print("\nPROGRAM FINISHED SUCCESSFULLY\n")
 
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Usage: python script.py <path_to_excel_sheet> <path_to_output_folder>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Collect and rename the supporting documents of every job in the monthly claim workbook.")
+    parser.add_argument("excel_path", nargs="?", help="Path to the claim Excel workbook")
+    parser.add_argument("output_folder", nargs="?", help="Folder the job folders are created in")
+    parser.add_argument("--io-workers", type=int, default=2, help="Number of files copied at the same time (default: 2)")
+    parser.add_argument("--link", action="store_true", help="Hard link instead of copying when the source and output folder are on the same drive")
+    parser.add_argument("--plan-only", action="store_true", help="Dry run: write the manifest and print the warnings without copying anything")
+    parser.add_argument("--manifest", help=f"Manifest file to write (default: {manifest_file_name} in the output folder)")
+    parser.add_argument("--execute", metavar="MANIFEST", help="Carry out an earlier manifest, resuming where it stopped, instead of planning")
+    args = parser.parse_args()
 
-    excel_path = sys.argv[1]
-    output_folder = sys.argv[2]
-
-    main(excel_path, output_folder)
+    if args.execute:
+        configure_transfers(args.io_workers, args.link)
+        with open(args.execute, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        execute(manifest, args.execute)
+        print("\nPROGRAM FINISHED SUCCESSFULLY\n")
+    elif args.excel_path and args.output_folder:
+        main(args.excel_path, args.output_folder, args.io_workers, args.link, args.plan_only, args.manifest)
+    else:
+        parser.error("the claim workbook and output folder are required unless --execute is given")
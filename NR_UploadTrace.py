@@ -0,0 +1,138 @@
+# This program records how long each step of the MediaSpace upload takes (NA&CCI_Web.py), and summarises the recorded traces per step
+
+import os
+import sys
+import json
+import math
+import time
+import threading
+import argparse
+from contextlib import contextmanager
+from datetime import datetime
+
+# Directory paths
+trace_file_path = r"F:\NR CCI UPLOADS\upload_trace.jsonl"
+
+trace_lock = threading.Lock()
+run_id = datetime.now().strftime('%Y%m%d_%H%M%S')
+
+# Function to append one timed step to the trace
+def record(step, seconds, row=None, attempt=None, bytes_uploaded=None, status="ok", error=None):
+    entry = {
+        "run": run_id,
+        "session": threading.current_thread().name,
+        "row": row,
+        "attempt": attempt,
+        "step": step,
+        "time": datetime.now().isoformat(timespec='seconds'),
+        "seconds": round(seconds, 3),
+        "bytes": bytes_uploaded,
+        "status": status,
+    }
+    if error is not None:
+        entry["error"] = error
+    with trace_lock:
+        with open(trace_file_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + "\n")
+
+# Function to time a block of code as one named step
+@contextmanager
+def span(step, row=None, attempt=None, bytes_uploaded=None):
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        record(step, time.perf_counter() - started, row, attempt, bytes_uploaded, "error", f"{type(e).__name__}: {e}")
+        raise
+    record(step, time.perf_counter() - started, row, attempt, bytes_uploaded)
+
+
+# Times the steps of one attempt at a row, one after another: starting a step ends the previous one
+class RowTrace:
+    def __init__(self, row, attempt):
+        self.row = row
+        self.attempt = attempt
+        self.row_started = time.perf_counter()
+        self.current_step = None
+
+    def step(self, name, bytes_uploaded=None):
+        self.end_step("ok")
+        self.current_step = (name, time.perf_counter(), bytes_uploaded)
+
+    def end_step(self, status, error=None):
+        if self.current_step is not None:
+            name, started, bytes_uploaded = self.current_step
+            record(name, time.perf_counter() - started, self.row, self.attempt, bytes_uploaded, status, error)
+            self.current_step = None
+
+    # Ends the current step and records the whole attempt as a "row" step
+    def close(self, status="ok", error=None):
+        self.end_step(status, error)
+        record("row", time.perf_counter() - self.row_started, self.row, self.attempt, None, status, error)
+
+
+# Function to read every entry from the given trace files
+def read_traces(file_paths):
+    entries = []
+    for file_path in file_paths:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    pass  # A line cut short by a crash
+    return entries
+
+# Function to get a percentile (nearest rank) of a list of numbers
+def percentile(values, percent):
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+# Function to print p50/p95/max per step and the upload throughput per run
+def print_summary(entries):
+    steps = {}
+    for entry in entries:
+        steps.setdefault(entry["step"], []).append(entry)
+
+    print(f"{'STEP':<18}{'COUNT':>7}{'ERRORS':>8}{'P50 (s)':>10}{'P95 (s)':>10}{'MAX (s)':>10}{'MB/s':>8}")
+    for step, step_entries in sorted(steps.items(), key=lambda item: -sum(e["seconds"] for e in item[1])):
+        seconds = [e["seconds"] for e in step_entries]
+        errors = sum(1 for e in step_entries if e["status"] != "ok")
+        transferred = [e for e in step_entries if e.get("bytes") and e["status"] == "ok"]
+        transfer_seconds = sum(e["seconds"] for e in transferred)
+        rate = f"{sum(e['bytes'] for e in transferred) / 1e6 / transfer_seconds:.2f}" if transfer_seconds else "-"
+        print(f"{step:<18}{len(seconds):>7}{errors:>8}{percentile(seconds, 50):>10.1f}{percentile(seconds, 95):>10.1f}{max(seconds):>10.1f}{rate:>8}")
+
+    print(f"\n{'RUN':<18}{'ROWS':>7}{'VIDEO MB':>10}{'MB/s':>8}{'ROWS/HOUR':>11}")
+    runs = {}
+    for entry in entries:
+        runs.setdefault(entry["run"], []).append(entry)
+    for run, run_entries in sorted(runs.items()):
+        rows = [e for e in run_entries if e["step"] == "row" and e["status"] == "ok"]
+        transfers = [e for e in run_entries if e["step"] == "video_transfer" and e["status"] == "ok" and e.get("bytes")]
+        video_mb = sum(e["bytes"] for e in transfers) / 1e6
+        transfer_seconds = sum(e["seconds"] for e in transfers)
+        rate = f"{video_mb / transfer_seconds:.2f}" if transfer_seconds else "-"
+        # Wall clock of the run, from its first to its last recorded step
+        times = [datetime.fromisoformat(e["time"]) for e in run_entries]
+        wall_seconds = (max(times) - min(times)).total_seconds()
+        rows_per_hour = f"{len(rows) * 3600 / wall_seconds:.1f}" if wall_seconds else "-"
+        print(f"{run:<18}{len(rows):>7}{video_mb:>10.1f}{rate:>8}{rows_per_hour:>11}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarise MediaSpace upload traces.")
+    parser.add_argument("traces", nargs="*", default=[trace_file_path], help="Trace files (default: the uploader's trace file)")
+    args = parser.parse_args()
+
+    missing = [file_path for file_path in args.traces if not os.path.exists(file_path)]
+    if missing:
+        print(f"TRACE FILE(S) NOT FOUND: {', '.join(missing)}")
+        sys.exit(1)
+
+    entries = read_traces(args.traces)
+    if not entries:
+        print("NO TRACE ENTRIES FOUND")
+        sys.exit(1)
+    print_summary(entries)
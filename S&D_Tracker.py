@@ -1,5 +1,6 @@
 import openpyxl
 from openpyxl import load_workbook
+import bisect
 import datetime
 
 # Function to get user input
@@ -18,22 +19,42 @@ def append_to_cell(cell, text):
 def capitalize_comment(comment):
     return comment.upper()
 
+# Function to index the worksheet's rows by the asset number in column F, read once when the workbook is loaded
+# The first row holding an asset number is the one updated, as before. Column F is never written in a session, so the index stays valid
+def index_asset_rows(worksheet):
+    asset_column_index = 5  # Column F is the 6th column, index 5
+    asset_rows = {}
+    for row in worksheet.iter_rows(min_row=1, max_col=worksheet.max_column):
+        asset_number = row[asset_column_index].value
+        if asset_number is not None and asset_number not in asset_rows:
+            asset_rows[asset_number] = row
+    return asset_rows
+
 # Function to check if asset numbers exist in the spreadsheet
-def check_asset_numbers(asset_list, worksheet):
+def check_asset_numbers(asset_list, asset_rows):
     existing_assets = []
     non_existing_assets = []
-    asset_column_index = 5  # Column F is the 6th column, index 5
     for asset_number in asset_list:
-        found = False
-        for row in worksheet.iter_rows(min_row=1, max_col=worksheet.max_column):
-            if row[asset_column_index].value == asset_number:
-                existing_assets.append(asset_number)
-                found = True
-                break
-        if not found:
+        if asset_number in asset_rows:
+            existing_assets.append(asset_number)
+        else:
             non_existing_assets.append(asset_number)
     return existing_assets, non_existing_assets
 
+# Function to suggest asset numbers starting with what was typed, dropping a character from the end at a time
+# (down to 3) until something matches, so a mistyped last digit still finds its neighbours
+def suggest_asset_numbers(typed, sorted_assets, limit=5):
+    for length in range(len(typed), 2, -1):
+        prefix = typed[:length]
+        position = bisect.bisect_left(sorted_assets, prefix)
+        suggestions = []
+        while position < len(sorted_assets) and sorted_assets[position].startswith(prefix) and len(suggestions) < limit:
+            suggestions.append(sorted_assets[position])
+            position += 1
+        if suggestions:
+            return suggestions
+    return []
+
 # Dictionary to map WO numbers to file paths
 file_paths = {
     "TEST": r"F:\SND MBK TEST.xlsx",
@@ -54,6 +75,10 @@ if file_path:
     wb = load_workbook(file_path)
     ws = wb.active
 
+    # Asset number -> its row, for every asset in column F, and the asset numbers in order for suggestions
+    asset_rows = index_asset_rows(ws)
+    sorted_assets = sorted(str(asset_number) for asset_number in asset_rows)
+
     # Get initial user inputs
     date_str = get_user_input("Enter the date (dd/mm/yyyy): ")
     date = datetime.datetime.strptime(date_str, "%d/%m/%Y").date()
@@ -70,10 +95,14 @@ if file_path:
 
         asset_list = asset_numbers.split()
 
-        existing_assets, non_existing_assets = check_asset_numbers(asset_list, ws)
+        existing_assets, non_existing_assets = check_asset_numbers(asset_list, asset_rows)
 
         if non_existing_assets:
             print(f"ASSET NUMBER(S) {', '.join(non_existing_assets)} NOT FOUND IN COLUMN F.")
+            for asset_number in non_existing_assets:
+                suggestions = suggest_asset_numbers(asset_number, sorted_assets)
+                if suggestions:
+                    print(f"  {asset_number}: DID YOU MEAN {', '.join(suggestions)}?")
             continue  # Skip the rest of the loop and ask for asset numbers again
 
         if len(existing_assets) > 1:
@@ -102,20 +131,18 @@ if file_path:
                 requirements = get_user_input("State any requirements: ").strip()
 
             for asset_number in existing_assets:
-                for row in ws.iter_rows(min_row=1, max_col=ws.max_column):
-                    if row[5].value == asset_number:
-                        row[18].value = 'Y' if tc_used == 'y' else 'N'
-                        row[17].value = 'Y' if has_video == 'y' else 'N'
-                        append_to_cell(row[19], docket_number)
-                        append_to_cell(row[14], f"{date_str} - {comments[asset_number]}")
-                        append_to_cell(row[13], jds_number)
-                        if is_complete == 'y':
-                            row[11].value = "FINISHED"
-                            row[16].value = "Complete"
-                            row[12].value = date_str
-                        else:
-                            row[15].value = requirements if is_multi == 'y' else get_user_input(f"State requirements for {asset_number}: ").strip()
-                        break
+                row = asset_rows[asset_number]
+                row[18].value = 'Y' if tc_used == 'y' else 'N'
+                row[17].value = 'Y' if has_video == 'y' else 'N'
+                append_to_cell(row[19], docket_number)
+                append_to_cell(row[14], f"{date_str} - {comments[asset_number]}")
+                append_to_cell(row[13], jds_number)
+                if is_complete == 'y':
+                    row[11].value = "FINISHED"
+                    row[16].value = "Complete"
+                    row[12].value = date_str
+                else:
+                    row[15].value = requirements if is_multi == 'y' else get_user_input(f"State requirements for {asset_number}: ").strip()
 
         elif len(existing_assets) == 1:
             has_video = get_user_input("Does this asset have a video? (y/n): ").strip().lower()
@@ -127,21 +154,19 @@ if file_path:
             if is_complete == 'n':
                 requirements = get_user_input("State any requirements: ").strip()
 
-            for row in ws.iter_rows(min_row=1, max_col=ws.max_column):
-                if row[5].value == asset_numbers:
-                    row[18].value = 'Y' if tc_used == 'y' else 'N'
-                    row[17].value = 'Y' if has_video == 'y' else 'N'
-                    append_to_cell(row[19], docket_number)
-                    append_to_cell(row[14], f"{date_str} - {capitalized_comment}")
-                    append_to_cell(row[13], jds_number)
-                    if is_complete == 'y':
-                        row[11].value = "FINISHED"
-                        row[16].value = "Complete"
-                        row[12].value = date_str
-                    else:
-                        if requirements:
-                            row[15].value = requirements
-                    break
+            row = asset_rows[existing_assets[0]]
+            row[18].value = 'Y' if tc_used == 'y' else 'N'
+            row[17].value = 'Y' if has_video == 'y' else 'N'
+            append_to_cell(row[19], docket_number)
+            append_to_cell(row[14], f"{date_str} - {capitalized_comment}")
+            append_to_cell(row[13], jds_number)
+            if is_complete == 'y':
+                row[11].value = "FINISHED"
+                row[16].value = "Complete"
+                row[12].value = date_str
+            else:
+                if requirements:
+                    row[15].value = requirements
 
     # Save the workbook
     wb.save(file_path)
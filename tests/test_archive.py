@@ -0,0 +1,69 @@
+# Tests for NR_Archive: batches compiled more than once in the same month, and inspections flagged once they were uploaded
+
+from datetime import datetime
+import pandas as pd
+import NR_Archive
+
+
+# Function to build a compiled-batch frame shaped like the compiler output
+def make_batch(wos):
+    return pd.DataFrame({
+        "JSA/WO": wos,
+        "Pipe Asset ID": [f"PA{wo}" for wo in wos],
+        "Date of inspection": ["01/05/2024"] * len(wos),
+        "Time of inspection": ["10:00"] * len(wos),
+        "Attempt #": [1] * len(wos),
+    })
+
+
+# Function to pretend the archive is being written in another month
+def freeze_month(monkeypatch, year, month):
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return cls(year, month, 15, 9, 0, 0)
+    monkeypatch.setattr(NR_Archive, "datetime", FrozenDatetime)
+
+
+def test_compile_twice_in_same_month(tmp_path):
+    path = str(tmp_path / "archive")
+    batch = make_batch([91171698, 91171699])
+
+    assert NR_Archive.previous_uploads(batch, path).tolist() == ["", ""]
+    assert NR_Archive.append_batch(batch, path) == 2
+
+    # A --full re-run later in the month: compiling alone never flags a row
+    assert NR_Archive.previous_uploads(batch, path).tolist() == ["", ""]
+    assert NR_Archive.append_batch(batch, path) == 0
+    assert len(NR_Archive.find_inspections(path=path)) == 2
+
+
+def test_only_uploaded_inspections_are_flagged(tmp_path, monkeypatch):
+    path = str(tmp_path / "archive")
+    freeze_month(monkeypatch, 2024, 5)
+    NR_Archive.append_batch(make_batch([91171698, 91171699]), path)
+    # Only the first row was uploaded; the second stayed in PENDING
+    assert NR_Archive.record_uploads(make_batch([91171698]), path) == 1
+    assert NR_Archive.record_uploads(make_batch([91171698]), path) == 0
+
+    freeze_month(monkeypatch, 2024, 6)
+    assert NR_Archive.previous_uploads(make_batch([91171698, 91171699]), path).tolist() == ["2024-05", ""]
+    assert NR_Archive.append_batch(make_batch([91171698, 91171699]), path) == 0
+
+    # The upload records are not read as compiled batches
+    found = NR_Archive.find_inspections(path=path)
+    assert len(found) == 2
+    assert found["Uploaded Month"].tolist() == ["2024-05", ""]
+
+
+def test_empty_batch(tmp_path):
+    path = str(tmp_path / "archive")
+    empty = make_batch([])
+
+    assert NR_Archive.append_batch(empty, path) == 0
+    assert NR_Archive.record_uploads(empty, path) == 0
+    NR_Archive.append_batch(make_batch([91171698]), path)
+    NR_Archive.record_uploads(make_batch([91171698]), path)
+    assert NR_Archive.previous_uploads(empty, path).tolist() == []
+    assert NR_Archive.append_batch(empty, path) == 0
+    assert list(NR_Archive.inspection_keys(empty)) == []
@@ -0,0 +1,126 @@
+# Tests for NR_Inspections: the single-pass close-inspection filter must keep the same rows as the per-WO loop it replaced
+
+import random
+import pandas as pd
+import NR_Inspections
+
+
+# The per-WO loop the compiler used before the single-pass filter, kept here as the reference.
+# The DateTime column comes from parse_inspection_datetime, since plain pd.to_datetime cannot read
+# sheets that mix times with and without seconds or leave the date/time empty
+def remove_close_inspections_per_wo(df):
+    df['DateTime'] = NR_Inspections.parse_inspection_datetime(df)
+    filtered_df = pd.DataFrame(columns=df.columns)
+    for wo in df['JSA/WO'].unique():
+        wo_df = df[df['JSA/WO'] == wo].sort_values(by='DateTime', ascending=False)
+        wo_df = wo_df.reset_index(drop=True)
+        keep_rows = []
+        for i in range(len(wo_df)):
+            if not keep_rows:
+                keep_rows.append(i)
+            else:
+                if (wo_df.loc[keep_rows[-1], 'DateTime'] - wo_df.loc[i, 'DateTime']).total_seconds() >= 36000:
+                    keep_rows.append(i)
+        filtered_df = pd.concat([filtered_df, wo_df.loc[keep_rows]], ignore_index=True)
+    filtered_df = filtered_df.drop(columns=['DateTime'])
+    return filtered_df
+
+
+# Gaps between consecutive inspections of a WO, including the ones on either side of 10 hours
+gaps = [pd.Timedelta(hours=10) + pd.Timedelta(seconds=s) for s in (-60, -1, 0, 1, 60)] + [
+    pd.Timedelta(minutes=30), pd.Timedelta(hours=3), pd.Timedelta(hours=9, minutes=59), pd.Timedelta(hours=20), pd.Timedelta(days=3)]
+
+
+# Function to build a compiled frame shaped like the compiler's: several rows per WO, times with and without
+# seconds, and now and then a missing date or time
+def make_compiled_frame(rng):
+    rows = []
+    for wo in rng.sample(range(91170000, 91179999), rng.randint(1, 8)):
+        when = pd.Timestamp(2024, rng.randint(1, 12), rng.randint(1, 28), rng.randint(0, 23), rng.randint(0, 59), rng.choice([0, 0, rng.randint(1, 59)]))
+        missing_row = rng.random() < 0.3
+        for i in range(rng.randint(1, 6)):
+            date = when.strftime('%d/%m/%Y')
+            time = when.strftime('%H:%M') if when.second == 0 and rng.random() < 0.5 else when.strftime('%H:%M:%S')
+            # At most one unreadable row per WO, so the reference loop's unstable sort has no ties to order
+            if missing_row and i == 0:
+                if rng.random() < 0.5:
+                    date = None
+                else:
+                    time = None
+            rows.append({"Attempt #": 1, "Pipe Asset ID": f"PA{wo}-{i}", "Date of inspection": date, "Time of inspection": time, "JSA/WO": wo})
+            when += rng.choice(gaps)
+    df = pd.DataFrame(rows)
+    df["Row"] = range(len(df))
+    # The compiler sorts before filtering
+    return df.sort_values(by=["JSA/WO", "Date of inspection", "Time of inspection"])
+
+
+def test_matches_per_wo_loop():
+    rng = random.Random(20240501)
+    for _ in range(300):
+        df = make_compiled_frame(rng)
+        expected = remove_close_inspections_per_wo(df.copy())
+        kept = NR_Inspections.remove_close_inspections(df)
+        assert kept["Row"].tolist() == expected["Row"].tolist()
+        assert list(kept.columns) == list(df.columns)
+
+
+def test_ten_hour_boundary():
+    df = pd.DataFrame({
+        "JSA/WO": [91171698] * 4 + [91171699] * 2,
+        "Date of inspection": ["01/05/2024", "01/05/2024", "02/05/2024", "02/05/2024", "01/05/2024", "01/05/2024"],
+        "Time of inspection": ["08:00", "17:59:59", "03:59:59", "04:00:00", "08:00:00", "18:00"],
+        "Row": range(6),
+    })
+    kept = NR_Inspections.remove_close_inspections(df)
+    # 91171698: 04:00:00 is kept, 03:59:59 is 1 s before it, 17:59:59 is 10 h 1 s before it, 08:00 is 9 h 59 min 59 s before that
+    # 91171699: exactly 10 h apart, both kept
+    assert kept["Row"].tolist() == [3, 1, 5, 4]
+
+
+def test_parse_inspection_datetime():
+    df = pd.DataFrame({
+        "Date of inspection": ["01/05/2024", "01/05/2024", None, "01/05/2024", "2024-05-01"],
+        "Time of inspection": ["10:15:30", "10:15", "10:15", None, "10:15"],
+    })
+    parsed = NR_Inspections.parse_inspection_datetime(df)
+    assert parsed[0] == pd.Timestamp(2024, 5, 1, 10, 15, 30)
+    assert parsed[1] == pd.Timestamp(2024, 5, 1, 10, 15)
+    assert parsed[2:].isna().all()
+
+
+# The per-row values the uploader built before they were derived column-wise, kept here as the reference
+def upload_values_per_row(row):
+    asset_numbers = str(row['Pipe Asset ID']).replace(', ', '_')
+    title1 = '' if pd.isna(row['Priority Justification']) else str(row['Priority Justification'])
+    title = f"{title1}_{asset_numbers}_{int(row['JSA/WO'])}_{row['Location Scamp']}_{int(row['Attempt #'])}"
+    tag = "junctionjet" if "JJ" in str(row['Cleaning']) or "jj" in str(row['Cleaning']) else "cctv"
+    priority_justification = str(row['Priority Justification']) if any(val in str(row['Priority Justification']) for val in NR_Inspections.priority_justification_values) else "OTHER"
+    try:
+        inspection_time = pd.to_datetime(row['Time of inspection'], format='%H:%M:%S').time()
+    except ValueError:
+        inspection_time = pd.to_datetime(row['Time of inspection'], format='%H:%M').time()
+    inspection_date = pd.to_datetime(row['Date of inspection'], dayfirst=True)
+    if inspection_time <= pd.Timestamp("05:30").time():
+        inspection_date -= pd.Timedelta(days=1)
+    pdf_filename = f"{row['JSA/WO']} CCTV REPORT {inspection_date.strftime('%d%m%Y')}.pdf"
+    return [title, tag, priority_justification, pdf_filename]
+
+
+def test_upload_values_match_per_row():
+    # Rows as QA leaves them: Priority Justification and Location Scamp filled in (or left empty), Cleaning marked JJ or not
+    df = pd.DataFrame({
+        "JSA/WO": [91171698, 91171698, 91171699, 91171700],
+        "Attempt #": [1, 2, 1, 3],
+        "Pipe Asset ID": ["789", "789, 790", "12345", "555"],
+        "Priority Justification": ["CRIT", None, "ODOR - odour complaint", "misc"],
+        "Location Scamp": ["SCAMP1", None, "SCAMP2", "SCAMP3"],
+        "Cleaning": ["JJ", "No", None, "jj clean"],
+        "Date of inspection": ["01/05/2024", "01/05/2024", "02/05/2024", "03/05/2024"],
+        "Time of inspection": ["10:15:30", "05:30", "00:10:00", "05:31"],
+    })
+    derived = NR_Inspections.add_upload_columns(df)
+    columns = ["Upload Title", "Upload Tag", "Upload Priority Justification", "Upload PDF Report Name"]
+    for index, row in df.iterrows():
+        assert derived.loc[index, columns].tolist() == upload_values_per_row(row)
+    assert derived["Upload Title"].tolist()[:2] == ["CRIT_789_91171698_SCAMP1_1", "_789_790_91171698_nan_2"]